@@ -5,10 +5,9 @@ from starlette_admin.auth import AdminUser, AuthProvider
 from starlette_admin.exceptions import LoginFailed
 
 from schemas.user import RefreshToken
-from utils.app_exceptions import AppExceptionCase
 from utils.auth import refresh_token
 from utils.dependencies import get_current_user
-from cruds.user import UserCRUD
+from services.user import UserService
 from fastapi.security import OAuth2PasswordRequestForm
 from config.database import engine
 from sqlalchemy.orm import sessionmaker
@@ -39,11 +38,12 @@ class MyAuthProvider(AuthProvider):
         response: Response,
     ) -> Response:
         db = next(get_db())
-        tokens = UserCRUD(db).get_jwt_tokens(
+        result = await UserService(db).auth_user(
             OAuth2PasswordRequestForm(username=username, password=password)
         )
-        if isinstance(tokens, AppExceptionCase):
-            raise LoginFailed(tokens.detail)
+        if not result.success:
+            raise LoginFailed(result.value.detail)
+        tokens = result.value
         user = await get_current_user(db, tokens["access_token"])
         if user.is_superuser:
             request.session.update({"userdata": tokens})
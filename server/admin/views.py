@@ -1,5 +1,7 @@
+import asyncio
 from typing import Optional, List, Any, Dict
 import os
+import anyio
 from models.user import GenderEnum, BusinessEnum, NotificationTypeEnum
 from starlette.requests import Request
 from starlette_admin import (
@@ -25,6 +27,36 @@ from utils.auth import get_hashed_password, password_context
 from starlette.datastructures import UploadFile
 
 from utils.validators import upload_file
+from utils.catalog import catalog_snapshot
+from utils.geo_index import master_geo_index
+from utils.ledger import BALANCE_TOLERANCE, change_balance
+from utils.site_settings import settings_snapshot
+
+
+class SnapshotModelView(ModelView):
+    """Bumps the versions of the worker snapshots built from this model
+    after every write, so the workers rebuild them."""
+
+    snapshots = ()
+
+    async def invalidate_snapshots(self) -> None:
+        for snapshot in self.snapshots:
+            await asyncio.to_thread(snapshot.invalidate_once)
+
+    async def create(self, request: Request, data: Dict[str, Any]) -> Any:
+        obj = await super().create(request, data)
+        await self.invalidate_snapshots()
+        return obj
+
+    async def edit(self, request: Request, pk: Any, data: Dict[str, Any]) -> Any:
+        obj = await super().edit(request, pk, data)
+        await self.invalidate_snapshots()
+        return obj
+
+    async def delete(self, request: Request, pks: List[Any]) -> Optional[int]:
+        count = await super().delete(request, pks)
+        await self.invalidate_snapshots()
+        return count
 
 
 class ClientView(ModelView):
@@ -61,12 +93,34 @@ class ClientView(ModelView):
             entity_id = None
         data = await upload_file(data, "avatar", "client", entity_id, False)
         if not password_context.identify(data["password"]):
-            new_password = get_hashed_password(data["password"])
-            data["password"] = new_password
+            data["password"] = await get_hashed_password(data["password"])
         return await super().validate(request, data)
 
 
-class MasterView(ModelView):
+class MasterView(SnapshotModelView):
+    # Activation and address changes also move masters in the geo index.
+    snapshots = (catalog_snapshot, master_geo_index)
+
+    async def _populate_obj(
+        self,
+        request: Request,
+        obj: Any,
+        data: Dict[str, Any],
+        is_edit: bool = False,
+    ) -> Any:
+        balance = obj.balance or 0
+        obj = await super()._populate_obj(request, obj, data, is_edit)
+        amount = (obj.balance or 0) - balance
+        # A manual correction is applied as a ledger entry in the transaction
+        # edit commits, or the reconciliation would take it back.
+        if is_edit and abs(amount) > BALANCE_TOLERANCE:
+            session = request.state.session
+            session.expire(obj, ["balance"])
+            await anyio.to_thread.run_sync(
+                change_balance, session, obj.username, amount, "admin"
+            )
+        return obj
+
     fields = [
         "id",
         StringField("username", "Имя пользователя", required=True),
@@ -211,7 +265,9 @@ class FeedbackView(ModelView):
         return await super().validate(request, data)
 
 
-class CategoryView(ModelView):
+class CategoryView(SnapshotModelView):
+    snapshots = (catalog_snapshot,)
+
     fields = [
         "id",
         StringField("name", "Название", required=True),
@@ -219,7 +275,9 @@ class CategoryView(ModelView):
     ]
 
 
-class ServiceTypeView(ModelView):
+class ServiceTypeView(SnapshotModelView):
+    snapshots = (catalog_snapshot,)
+
     fields = [
         "id",
         StringField("name", "Название", required=True),
@@ -228,7 +286,10 @@ class ServiceTypeView(ModelView):
     ]
 
 
-class DeviceView(ModelView):
+class DeviceView(SnapshotModelView):
+    # Deletes cascade to the masters' repairs in the geo index.
+    snapshots = (catalog_snapshot, master_geo_index)
+
     fields = [
         "id",
         StringField("name", "Название", required=True),
@@ -251,7 +312,10 @@ class DeviceView(ModelView):
         return await super().validate(request, data)
 
 
-class RepairTypeView(ModelView):
+class RepairTypeView(SnapshotModelView):
+    # Deletes cascade to the masters' repairs in the geo index.
+    snapshots = (catalog_snapshot, master_geo_index)
+
     fields = [
         "id",
         StringField("name", "Название", required=True),
@@ -372,7 +436,9 @@ class CoverPictureView(ModelView):
         return await super().validate(request, data)
 
 
-class SettingsView(ModelView):
+class SettingsView(SnapshotModelView):
+    snapshots = (settings_snapshot,)
+
     fields = [
         FloatField(
             "commission",
@@ -0,0 +1,43 @@
+"""Per-email render cost of a mailing, rendering the whole template for every
+recipient versus rendering it once per campaign:
+
+    python -m benchmarks.email_render --recipients 10000
+"""
+
+import argparse
+import time
+
+from utils.email import CampaignTemplate, templates
+from utils.mailer import MAILING_SUBJECT
+
+
+def full_render(names: list[str]) -> list[str]:
+    template = templates["mailing.html"]
+    return [
+        template.render(entity_id=1, type=3, first_name=name, subject=MAILING_SUBJECT)
+        for name in names
+    ]
+
+
+def campaign_render(names: list[str]) -> list[str]:
+    campaign = CampaignTemplate(
+        "mailing.html", ("first_name",), entity_id=1, type=3, subject=MAILING_SUBJECT
+    )
+    return [campaign.render(first_name=name) for name in names]
+
+
+def measure(render, names: list[str]) -> float:
+    start = time.perf_counter()
+    render(names)
+    return (time.perf_counter() - start) / len(names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=10000)
+    args = parser.parse_args()
+    names = [f"Мастер {i} <&>" for i in range(args.recipients)]
+    assert full_render(names[:10]) == campaign_render(names[:10])
+    for render in (full_render, campaign_render):
+        cost = measure(render, names)
+        print(f"{render.__name__}: {cost * 1e6:.1f} µs per email")
@@ -16,3 +16,85 @@ CELERY_RESULT_BACKEND: str = os.environ.get(
 )
 COMMISSION: float = float(os.environ.get("COMMISSION"))
 SMS_API_ID = os.environ["SMS_API_KEY"]
+DATABASE_ASYNC: bool = os.environ.get("DATABASE_ASYNC", "0") == "1"
+DATABASE_POOL_SIZE: int = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW: int = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+SERVICE_EXECUTOR: str = os.environ.get("SERVICE_EXECUTOR", "inline")
+SERVICE_THREADPOOL_SIZE: int = int(
+    os.environ.get("SERVICE_THREADPOOL_SIZE", DATABASE_POOL_SIZE)
+)
+SERVICE_QUEUE_SIZE: int = int(os.environ.get("SERVICE_QUEUE_SIZE", 256))
+SOCKET_BACKPLANE: str = os.environ.get("SOCKET_BACKPLANE", "memory")
+SOCKET_BACKPLANE_URL: str = os.environ.get(
+    "SOCKET_BACKPLANE_URL", "redis://127.0.0.1:6379/1"
+)
+SOCKET_PRESENCE_TTL: int = int(os.environ.get("SOCKET_PRESENCE_TTL", 60))
+MEDIA_MAX_UPLOAD_SIZE: int = int(
+    os.environ.get("MEDIA_MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
+)
+MEDIA_CHUNK_SIZE: int = int(os.environ.get("MEDIA_CHUNK_SIZE", 1024 * 1024))
+VIEW_COUNTER: str = os.environ.get("VIEW_COUNTER", "memory")
+VIEW_COUNTER_URL: str = os.environ.get("VIEW_COUNTER_URL", "redis://127.0.0.1:6379/2")
+VIEW_FLUSH_INTERVAL: int = int(os.environ.get("VIEW_FLUSH_INTERVAL", 10))
+REQUEST_EXPIRY_BATCH_SIZE: int = int(os.environ.get("REQUEST_EXPIRY_BATCH_SIZE", 500))
+MASTER_SERVICES_CACHE_SIZE: int = int(
+    os.environ.get("MASTER_SERVICES_CACHE_SIZE", 10000)
+)
+MASTER_SERVICES_CACHE_TTL: int = int(os.environ.get("MASTER_SERVICES_CACHE_TTL", 60))
+CATALOG_CHECK_INTERVAL: float = float(os.environ.get("CATALOG_CHECK_INTERVAL", 5))
+CATALOG_MAX_AGE: float = float(os.environ.get("CATALOG_MAX_AGE", 300))
+GEO_INDEX_CELL_SIZE: float = float(os.environ.get("GEO_INDEX_CELL_SIZE", 0.1))
+GEO_INDEX_CHECK_INTERVAL: float = float(os.environ.get("GEO_INDEX_CHECK_INTERVAL", 10))
+GEO_INDEX_CHANGE_SLACK: float = float(os.environ.get("GEO_INDEX_CHANGE_SLACK", 60))
+GEO_INDEX_CHANGE_RETENTION: int = int(
+    os.environ.get("GEO_INDEX_CHANGE_RETENTION", 24 * 60 * 60)
+)
+MAP_CLUSTER_TILE_CACHE_SIZE: int = int(
+    os.environ.get("MAP_CLUSTER_TILE_CACHE_SIZE", 5000)
+)
+MAP_CLUSTER_TILE_CACHE_TTL: int = int(os.environ.get("MAP_CLUSTER_TILE_CACHE_TTL", 600))
+REQUEST_FANOUT_RADIUS: float = float(os.environ.get("REQUEST_FANOUT_RADIUS", 30))
+MAIL_POOL_SIZE: int = int(os.environ.get("MAIL_POOL_SIZE", 5))
+MAIL_TIMEOUT: float = float(os.environ.get("MAIL_TIMEOUT", 30))
+MAIL_BATCH_SIZE: int = int(os.environ.get("MAIL_BATCH_SIZE", 200))
+MAIL_MAX_RETRIES: int = int(os.environ.get("MAIL_MAX_RETRIES", 3))
+MAIL_RETRY_BACKOFF: int = int(os.environ.get("MAIL_RETRY_BACKOFF", 60))
+SMS_URL: str = os.environ.get("SMS_URL", "https://sms.ru/sms/send")
+SMS_TIMEOUT: float = float(os.environ.get("SMS_TIMEOUT", 5))
+SMS_MAX_CONNECTIONS: int = int(os.environ.get("SMS_MAX_CONNECTIONS", 20))
+SMS_MAX_RETRIES: int = int(os.environ.get("SMS_MAX_RETRIES", 2))
+SMS_RETRY_BACKOFF: float = float(os.environ.get("SMS_RETRY_BACKOFF", 0.5))
+SMS_BREAKER_THRESHOLD: int = int(os.environ.get("SMS_BREAKER_THRESHOLD", 5))
+SMS_BREAKER_RESET: float = float(os.environ.get("SMS_BREAKER_RESET", 30))
+YOOKASSA_WEBHOOK_CHECK_IP: bool = (
+    os.environ.get("YOOKASSA_WEBHOOK_CHECK_IP", "1") == "1"
+)
+PAYMENT_RECONCILE_MAX_AGE: int = int(
+    os.environ.get("PAYMENT_RECONCILE_MAX_AGE", 60 * 60 * 24)
+)
+PAYMENT_RECONCILE_BACKOFF: int = int(os.environ.get("PAYMENT_RECONCILE_BACKOFF", 60))
+PAYMENT_RECONCILE_MAX_BACKOFF: int = int(
+    os.environ.get("PAYMENT_RECONCILE_MAX_BACKOFF", 60 * 60)
+)
+PAYMENT_RECONCILE_BATCH_SIZE: int = int(
+    os.environ.get("PAYMENT_RECONCILE_BATCH_SIZE", 200)
+)
+PAYMENT_RECONCILE_CHUNK_SIZE: int = int(
+    os.environ.get("PAYMENT_RECONCILE_CHUNK_SIZE", 20)
+)
+PAYMENT_RECONCILE_CONCURRENCY: int = int(
+    os.environ.get("PAYMENT_RECONCILE_CONCURRENCY", 4)
+)
+PAYMENT_RECONCILE_LOCK_URL: str = os.environ.get(
+    "PAYMENT_RECONCILE_LOCK_URL", CELERY_BROKER_URL
+)
+PAYMENT_RECONCILE_LOCK_TIMEOUT: int = int(
+    os.environ.get("PAYMENT_RECONCILE_LOCK_TIMEOUT", 10 * 60)
+)
+SETTINGS_CHECK_INTERVAL: float = float(os.environ.get("SETTINGS_CHECK_INTERVAL", 5))
+PRINCIPAL_CACHE_SIZE: int = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL: int = int(os.environ.get("PRINCIPAL_CACHE_TTL", 30))
+PASSWORD_HASH_WORKERS: int = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+)
+PASSWORD_HASH_QUEUE_SIZE: int = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", 64))
@@ -1,11 +1,13 @@
-import os
-import base64
 from typing import List
+
+from fastapi import UploadFile
+
 from models.relationship import UnreadMessage
 from schemas.chat import DialogIn
 from services.main import AppCRUD
 from utils.app_exceptions import AppException
-from models.chat import Message, Dialog
+from utils.media import save_upload
+from models.chat import Message, Dialog, Attachment
 from sqlalchemy import or_
 
 
@@ -18,36 +20,32 @@ class ChatCRUD(AppCRUD):
             return True
         return False
 
-    def create_message(self, text: str, files, dialog_id: int, user_id: int) -> Message:
+    def create_attachment(self, file: UploadFile, user_id: int) -> Attachment:
+        attachment = Attachment(
+            uploader_id=user_id, name=file.filename, file=save_upload(file)
+        )
+        self.db.add(attachment)
+        self.db.commit()
+        self.db.refresh(attachment)
+        return attachment
+
+    def get_attachment_files(self, attachments: List[int], user_id: int) -> List[str]:
+        db_attachments = (
+            self.db.query(Attachment)
+            .filter(Attachment.id.in_(attachments), Attachment.uploader_id == user_id)
+            .all()
+        )
+        files = {attachment.id: attachment.file for attachment in db_attachments}
+        if len(files) != len(set(attachments)):
+            raise AppException.NotFoundException("Вложение не найдено!")
+        return [files[attachment_id] for attachment_id in attachments]
+
+    def create_message(
+        self, text: str, attachments: List[int], dialog_id: int, user_id: int
+    ) -> Message:
         message = Message(dialog_id=dialog_id, sender_id=user_id, message=text)
-        if files:
-            new_files = list()
-
-            for file in files:
-                if type(file) == dict:
-                    filename = file["name"]
-                    file_data = base64.b64decode(file["data"])
-                    if os.path.exists(f"media/files/{filename}"):
-                        i = 1
-                        paths_parts = [
-                            filename[: filename.rindex(".")],
-                            filename[filename.rindex(".") + 1 :],
-                        ]
-                        print(paths_parts)
-                        while os.path.exists(
-                            f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                        ):
-                            i += 1
-                        with open(
-                            f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                        ) as f:
-                            f.write(file_data)
-                            new_files.append(f.name[6:])
-                    else:
-                        with open(f"media/files/{filename}", "wb") as f:
-                            f.write(file_data)
-                            new_files.append(f.name[6:])
-            message.files = new_files
+        if attachments:
+            message.files = self.get_attachment_files(attachments, user_id)
 
         self.db.add(message)
         self.db.commit()
@@ -130,37 +128,14 @@ class ChatCRUD(AppCRUD):
         return new_messages
 
     def update_message(
-        self, message: Message, text: str, files: list | None
+        self, message: Message, text: str, files: list | None, attachments: list | None
     ) -> Message:
         if text:
             message.message = text
-        if files:
-            new_files = list()
-            for file in files:
-                if type(file) == str:
-                    new_files.append(file)
-                elif type(file) == dict:
-                    filename = file["name"]
-                    file_data = base64.b64decode(file["data"])
-                    if os.path.exists(f"media/files/{filename}"):
-                        i = 1
-                        paths_parts = [
-                            filename[: filename.rindex(".")],
-                            filename[filename.rindex(".") + 1 :],
-                        ]
-                        while os.path.exists(
-                            f"media/files/{paths_parts[0]}({i}){paths_parts[1]}"
-                        ):
-                            i += 1
-                        with open(
-                            f"media/files/{paths_parts[0]}({i}){paths_parts[1]}", "wb"
-                        ) as f:
-                            f.write(file_data)
-                        new_files.append(f"{paths_parts[0]}({i}){paths_parts[1]}")
-                    else:
-                        with open(f"media/files/{filename}", "wb") as f:
-                            f.write(file_data)
-                        new_files.append(filename)
+        if files or attachments:
+            new_files = [file for file in files or [] if type(file) == str]
+            if attachments:
+                new_files += self.get_attachment_files(attachments, message.sender_id)
             message.files = new_files
         self.db.commit()
         self.db.refresh(message)
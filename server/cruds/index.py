@@ -14,8 +14,6 @@ class IndexCRUD(AppCRUD):
         article = self.db.query(Article).filter(Article.id == id).first()
         if not article:
             return AppException.NotFoundException("Статья не найдена!")
-        article.views += 1
-        self.db.commit()
         return article
 
     def get_articles(self) -> List[Article]:
@@ -1,11 +1,21 @@
 from typing import List
 
+from sqlalchemy import or_
+
+from config.settings import MASTER_SERVICES_CACHE_SIZE, MASTER_SERVICES_CACHE_TTL
 from models import Master
 from models.relationship import MasterRepair
 from models.service import ServiceType, Device, ServiceCategory, RepairType
 from schemas.service import MasterRepairEdit, RepairTypeIn, RepairTypeEdit
 from services.main import AppCRUD
 from utils.app_exceptions import AppException
+from utils.cache import TTLCache
+from utils.geo_index import master_geo_index
+
+# Validated AllServices per master username.
+master_services_cache = TTLCache(
+    maxsize=MASTER_SERVICES_CACHE_SIZE, ttl=MASTER_SERVICES_CACHE_TTL
+)
 
 
 class ServiceCRUD(AppCRUD):
@@ -68,7 +78,9 @@ class ServiceCRUD(AppCRUD):
             time=data.time,
         )
         self.db.add(new_master_repair)
+        master_geo_index.mark_changed(self.db, master.username)
         self.db.commit()
+        master_services_cache.delete(master.username)
         return new_repair_type
 
     def get_repair_type(self, id: int) -> RepairType:
@@ -129,72 +141,76 @@ class ServiceCRUD(AppCRUD):
                 address_latitude=master.address_latitude,
             )
             self.db.add(new_master_repair)
+            master_geo_index.mark_changed(self.db, master.username)
             self.db.commit()
             self.db.refresh(new_master_repair)
+            master_services_cache.delete(master.username)
             return new_master_repair
         for attr in data.model_dump(exclude_unset=True):
             if hasattr(master_repair, attr):
                 setattr(master_repair, attr, data.__getattribute__(attr))
+        master_geo_index.mark_changed(self.db, master.username)
         self.db.commit()
         self.db.refresh(master_repair)
+        master_services_cache.delete(master.username)
         return master_repair
 
-    def get_all_master_repairs(self) -> List[MasterRepair]:
-        master_repairs = self.db.query(MasterRepair).all()
-        master_usernames = set()
-        new_master_repairs = list()
-        for master_repair in master_repairs:
-            if master_repair.master_id in master_usernames:
-                continue
-            master = (
-                self.db.query(Master)
-                .filter(Master.username == master_repair.master_id)
-                .first()
+    def get_all_master_repairs(self, master_username: str | None) -> List[dict]:
+        query = (
+            self.db.query(
+                MasterRepair.repair_id,
+                MasterRepair.master_id,
+                MasterRepair.address_latitude,
+                MasterRepair.address_longitude,
+                MasterRepair.price,
+                MasterRepair.time,
+                Device.name.label("device"),
+                Device.id.label("device_id"),
+                RepairType.name.label("repair_name"),
+                RepairType.description.label("repair_description"),
+                RepairType.is_custom,
+            )
+            .join(Master, Master.username == MasterRepair.master_id)
+            .join(RepairType, RepairType.id == MasterRepair.repair_id)
+            .join(Device, Device.id == RepairType.device_id)
+            .filter(Master.is_active.is_(True))
+        )
+        if master_username is not None:
+            # Custom repair types are only listed for the master who made them.
+            query = query.filter(
+                MasterRepair.master_id == master_username,
+                or_(
+                    RepairType.is_custom.isnot(True),
+                    RepairType.created_by == master_username,
+                ),
             )
-            if not master:
-                continue
-            if not master.is_active:
-                master_usernames.add(master.username)
-            else:
-                new_master_repairs.append(master_repair)
-        return list(new_master_repairs)
+        return [dict(row._mapping) for row in query.all()]
 
     def get_all_master_services(self, username: str) -> dict:
-        master_repairs = (
-            self.db.query(MasterRepair).filter(MasterRepair.master_id == username).all()
+        repair_ids = (
+            self.db.query(MasterRepair.repair_id)
+            .filter(MasterRepair.master_id == username)
+            .scalar_subquery()
         )
-        response = dict()
-        devices = set()
-        repairs = set()
-        services = set()
-        response["service_types"] = list()
-        response["devices"] = list()
-        response["repair_types"] = list()
-        for master_repair in master_repairs:
-            if master_repair in repairs:
-                continue
-            repair = (
-                self.db.query(RepairType)
-                .filter(RepairType.id == master_repair.repair_id)
-                .first()
-            )
-            response["repair_types"].append(repair)
-            repairs.add(repair.id)
-            if repair.device_id in devices:
-                continue
-            device = self.db.query(Device).filter(Device.id == repair.device_id).first()
-            response["devices"].append(device)
-            devices.add(device.id)
-            if device.service_id in services:
-                continue
-            service = (
-                self.db.query(ServiceType)
-                .filter(ServiceType.id == device.service_id)
-                .first()
-            )
-            response["service_types"].append(service)
-            services.add(service.id)
-        return response
+        device_ids = (
+            self.db.query(RepairType.device_id)
+            .filter(RepairType.id.in_(repair_ids))
+            .scalar_subquery()
+        )
+        service_ids = (
+            self.db.query(Device.service_id)
+            .filter(Device.id.in_(device_ids))
+            .scalar_subquery()
+        )
+        return {
+            "repair_types": self.db.query(RepairType)
+            .filter(RepairType.id.in_(repair_ids))
+            .all(),
+            "devices": self.db.query(Device).filter(Device.id.in_(device_ids)).all(),
+            "service_types": self.db.query(ServiceType)
+            .filter(ServiceType.id.in_(service_ids))
+            .all(),
+        }
 
     def delete_master_repair_by_repair_id(
         self, repair_id: int, master: Master
@@ -212,5 +228,7 @@ class ServiceCRUD(AppCRUD):
                 "Связь между мастером и видом ремонта не найдена!"
             )
         self.db.delete(master_repair)
+        master_geo_index.mark_changed(self.db, master.username)
         self.db.commit()
+        master_services_cache.delete(master.username)
         return {"result": "Success!"}
@@ -1,10 +1,9 @@
 import datetime
-import os
 from typing import List
 
 from fastapi import BackgroundTasks
+from sqlalchemy import func, literal_column, or_
 
-from worker import delete_request
 from fastapi import UploadFile
 import models.user
 from cruds.user import UserCRUD
@@ -15,16 +14,22 @@ from models.submission import (
     Offer,
     SubmissionFeedback,
     StatusEnum,
+    SEARCH_CONFIG,
 )
 from models.user import Master
 from models.relationship import OrderRepair
 from services.main import AppCRUD
 from utils.app_exceptions import AppException
+from utils.matching import get_request_candidates
+from utils.media import save_upload
+from utils.geo import EARTH_RADIUS_KM, bounding_box
+from utils.pagination import paginate
 from schemas.submission import (
     OrderIn,
     OrderEdit,
     RequestIn,
     RequestEdit,
+    RequestSearch,
     OfferIn,
     OfferEdit,
     FeedbackIn,
@@ -33,7 +38,7 @@ from schemas.submission import (
 
 
 class SubmissionCRUD(AppCRUD):
-    async def create_order(
+    def create_order(
         self, data: OrderIn, user: models.user.Client, bg_tasks: BackgroundTasks
     ) -> Order:
         order = Order(
@@ -60,26 +65,19 @@ class SubmissionCRUD(AppCRUD):
         user.number_of_submissions += 1
         self.db.commit()
 
-        bg_tasks.add_task(
-            UserCRUD(self.db).send_mailing,
-            data.master_username,
-            order_id=order.id,
-            request_id=None,
-        )
+        recipients = UserCRUD(self.db).get_mailing_recipients(data.master_username)
+        UserCRUD(self.db).send_mailing(recipients, order_id=order.id)
         return order
 
     def get_order_by_id(self, id: int) -> Order:
         order = self.db.query(Order).filter(Order.id == id).first()
         return order
 
-    def get_orders_by_client_id(self, client_id: int) -> List[Order]:
-        orders = (
-            self.db.query(Order)
-            .filter(Order.client_id == client_id)
-            .order_by(Order.created_at)
-            .all()
-        )
-        return list(orders)[::-1]
+    def get_orders_by_client_id(
+        self, client_id: int, cursor: str | None, limit: int
+    ) -> dict:
+        query = self.db.query(Order).filter(Order.client_id == client_id)
+        return paginate(query, Order, cursor, limit)
 
     def get_orders_by_master_username(self, master: Master) -> List[Order]:
         orders = (
@@ -109,7 +107,9 @@ class SubmissionCRUD(AppCRUD):
                 user.number_of_submissions += 1
                 order.master_time = data.master_time
                 order.master_message = data.master_message
-                UserCRUD(self.db).write_commission_off(user, order.client_price)
+                UserCRUD(self.db).write_commission_off(
+                    user, order.client_price, f"order:{order.id}"
+                )
             order.status = data.status
         self.db.commit()
         self.db.refresh(order)
@@ -132,7 +132,7 @@ class SubmissionCRUD(AppCRUD):
             order.status = status
             master = UserCRUD(self.db).get_master_by_username(order.master_username)
             UserCRUD(self.db).charge_commission(
-                master.get("username"), order.client_price
+                master.get("username"), order.client_price, f"order:{order.id}"
             )
         elif status == StatusEnum.submitted:
             if order.status != StatusEnum.completed:
@@ -155,15 +155,17 @@ class SubmissionCRUD(AppCRUD):
         self.db.commit()
         return "Success!"
 
-    async def create_request(
+    def create_request(
         self,
         data: RequestIn,
         user: models.user.Client,
         bg_tasks: BackgroundTasks,
         files: List[UploadFile] = list,
     ) -> ServiceRequest | Exception:
+        # A request without a service type is offered to every nearby master.
         if (
-            self.db.query(ServiceType)
+            data.service_type_id is not None
+            and self.db.query(ServiceType)
             .filter(ServiceType.id == data.service_type_id)
             .first()
             is None
@@ -175,75 +177,141 @@ class SubmissionCRUD(AppCRUD):
             description=data.description,
             client_price=data.client_price,
             service_type_id=data.service_type_id,
+            latitude=data.latitude,
+            longitude=data.longitude,
             expires_at=datetime.datetime.now() + datetime.timedelta(days=1),
         )
-        new_files = list()
         if files:
-            for file in files:
-                if os.path.exists(f"media/files/{file.filename}"):
-                    i = 1
-                    paths_parts = [
-                        file.filename[: file.filename.rindex(".")],
-                        file.filename[file.filename.rindex(".") + 1 :],
-                    ]
-                    while os.path.exists(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                    ):
-                        i += 1
-                    with open(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                    ) as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                else:
-                    with open(f"media/files/{file.filename}", "wb") as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                new_files.append(link)
-            request.pictures = new_files
+            request.pictures = [save_upload(file) for file in files]
         self.db.add(request)
         user.number_of_submissions += 1
         self.db.commit()
         self.db.refresh(request)
-        delete_request.apply_async(kwargs={"request_id": request.id}, countdown=86400)
 
+        candidates = get_request_candidates(
+            self.db, request.service_type_id, request.latitude, request.longitude
+        )
+        clients = [
+            (client, mailing)
+            for client, mailing in UserCRUD(self.db).get_masters_clients(candidates)
+            if client.id != user.id
+        ]
+        UserCRUD(self.db).send_mailing(
+            [client for client, mailing in clients if mailing], request_id=request.id
+        )
         bg_tasks.add_task(
-            UserCRUD(self.db).send_mailing,
-            "__all__",
-            order_id=None,
-            request_id=request.id,
+            UserCRUD(self.db).send_realtime,
+            {"type": 6, "sender": user.id, "request": request.id},
+            [client.id for client, _ in clients],
         )
         return request
 
+    def delete_expired_requests(self, batch_size: int) -> int:
+        # Each batch is one DELETE over ix_service_request_status_expires_at;
+        # SKIP LOCKED keeps a slow sweep from blocking clients editing rows.
+        deleted = 0
+        while True:
+            expired_ids = (
+                self.db.query(ServiceRequest.id)
+                .filter(
+                    ServiceRequest.status == StatusEnum.active,
+                    ServiceRequest.expires_at <= datetime.datetime.now(),
+                )
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            count = (
+                self.db.query(ServiceRequest)
+                .filter(ServiceRequest.id.in_(expired_ids))
+                .delete(synchronize_session=False)
+            )
+            self.db.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
     def get_request_by_id(self, id: int) -> ServiceRequest:
         request = self.db.query(ServiceRequest).filter(ServiceRequest.id == id).first()
-        request.views += 1
-        self.db.commit()
-        self.db.refresh(request)
         return request
 
-    def get_requests(self, user_id: int) -> List[ServiceRequest]:
-        requests = (
-            self.db.query(ServiceRequest)
-            .filter(
-                ServiceRequest.status != "В процессе",
-                ServiceRequest.client_id != user_id,
-            )
-            .order_by(ServiceRequest.created_at)
-            .all()
+    def get_requests(self, user_id: int, cursor: str | None, limit: int) -> dict:
+        query = self.db.query(ServiceRequest).filter(
+            ServiceRequest.status != "В процессе",
+            ServiceRequest.client_id != user_id,
         )
-        return list(requests)[::-1]
+        return paginate(query, ServiceRequest, cursor, limit)
 
-    def get_requests_by_client_id(self, client_id) -> List[ServiceRequest]:
-        requests = (
-            self.db.query(ServiceRequest)
-            .filter(ServiceRequest.client_id == client_id)
-            .order_by(ServiceRequest.created_at)
-            .all()
+    def search_requests(
+        self, user_id: int, search: RequestSearch, cursor: str | None, limit: int
+    ) -> dict:
+        query = self.db.query(ServiceRequest).filter(
+            ServiceRequest.client_id != user_id
         )
-        return list(requests)[::-1] if len(requests) else []
+        if search.status:
+            query = query.filter(ServiceRequest.status == search.status)
+        else:
+            query = query.filter(ServiceRequest.status != StatusEnum.processing)
+        if search.service_type_id is not None:
+            query = query.filter(
+                ServiceRequest.service_type_id == search.service_type_id
+            )
+        if search.price_min is not None:
+            query = query.filter(ServiceRequest.client_price >= search.price_min)
+        if search.price_max is not None:
+            query = query.filter(ServiceRequest.client_price <= search.price_max)
+        if search.created_from is not None:
+            query = query.filter(ServiceRequest.created_at >= search.created_from)
+        if search.created_to is not None:
+            query = query.filter(ServiceRequest.created_at <= search.created_to)
+        if search.text:
+            query = query.filter(self._text_filter(search.text))
+        if None not in (search.latitude, search.longitude, search.radius):
+            min_lat, max_lat, min_lon, max_lon = bounding_box(
+                search.latitude, search.longitude, search.radius
+            )
+            query = query.filter(
+                ServiceRequest.latitude.between(min_lat, max_lat),
+                ServiceRequest.longitude.between(min_lon, max_lon),
+                self._distance(search.latitude, search.longitude) <= search.radius,
+            )
+        return paginate(query, ServiceRequest, cursor, limit)
+
+    def _text_filter(self, text: str):
+        if self.db.get_bind().dialect.name != "postgresql":
+            pattern = f"%{text}%"
+            return or_(
+                ServiceRequest.title.ilike(pattern),
+                ServiceRequest.description.ilike(pattern),
+            )
+        # Spelled exactly like ix_service_request_search so the planner can
+        # use the GIN index.
+        config = literal_column(f"'{SEARCH_CONFIG}'")
+        document = func.to_tsvector(
+            config,
+            ServiceRequest.title.op("||")(literal_column("' '")).op("||")(
+                ServiceRequest.description
+            ),
+        )
+        return document.op("@@")(func.plainto_tsquery(config, text))
+
+    @staticmethod
+    def _distance(latitude: float, longitude: float):
+        lat1, lon1 = func.radians(latitude), func.radians(longitude)
+        lat2 = func.radians(ServiceRequest.latitude)
+        lon2 = func.radians(ServiceRequest.longitude)
+        a = func.power(func.sin((lat2 - lat1) / 2), 2) + func.cos(lat1) * func.cos(
+            lat2
+        ) * func.power(func.sin((lon2 - lon1) / 2), 2)
+        return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(a))
+
+    def get_requests_by_client_id(
+        self, client_id: int, cursor: str | None, limit: int
+    ) -> dict:
+        query = self.db.query(ServiceRequest).filter(
+            ServiceRequest.client_id == client_id
+        )
+        return paginate(query, ServiceRequest, cursor, limit)
 
     def update_request_by_id(
         self, id: int, data: RequestEdit, user_id: int
@@ -276,7 +344,9 @@ class SubmissionCRUD(AppCRUD):
             )
             if not offer:
                 return AppException.NotFoundException("Предложение не найдено!")
-            UserCRUD(self.db).charge_commission(offer.master_username, offer.price)
+            UserCRUD(self.db).charge_commission(
+                offer.master_username, offer.price, f"offer:{offer.id}"
+            )
             self.db.commit()
             self.db.refresh(request)
             return request
@@ -402,7 +472,9 @@ class SubmissionCRUD(AppCRUD):
             return AppException.NotFoundException("Предложение не найдено!")
         if offer.request.client_id != client.id:
             return AppException.ForbiddenException("Нет доступа!")
-        UserCRUD(self.db).write_commission_off(offer.master, offer.price)
+        UserCRUD(self.db).write_commission_off(
+            offer.master, offer.price, f"offer:{offer.id}"
+        )
         offer.request.status = StatusEnum.processing
         offer.is_accepted = True
         offer.master.number_of_submissions += 1
@@ -441,31 +513,7 @@ class SubmissionCRUD(AppCRUD):
             master_username=data.master_username,
         )
         if pictures:
-            new_files = list()
-            for file in pictures:
-                if os.path.exists(f"media/files/{file.filename}"):
-                    i = 1
-                    paths_parts = [
-                        file.filename[: file.filename.rindex(".")],
-                        file.filename[file.filename.rindex(".") + 1 :],
-                    ]
-                    while os.path.exists(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                    ):
-                        i += 1
-                    with open(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                    ) as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                else:
-                    with open(f"media/files/{file.filename}", "wb") as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                new_files.append(link)
-            new_feedback.pictures = new_files
+            new_feedback.pictures = [save_upload(file, image=True) for file in pictures]
         self.db.add(new_feedback)
 
         master = (
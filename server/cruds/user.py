@@ -2,15 +2,19 @@ import datetime
 from random import randint
 from typing import List
 from fastapi import UploadFile
-import os
 from models.relationship import UnreadMessage
-from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import HTTPException, BackgroundTasks
+from fastapi import HTTPException
 from utils.phone import SMSTransport
-import models
+from sqlalchemy import inspect
 from cruds.service import ServiceCRUD
 from models import Master, MasterRepair, NotificationTypeEnum
-from models.user import Client, RefreshToken, Notification, Payment as DBPayment
+from models.user import (
+    Client,
+    RefreshToken,
+    Notification,
+    MailDelivery,
+    Payment as DBPayment,
+)
 from schemas.user import (
     ClientRegister,
     MasterRegister,
@@ -21,24 +25,28 @@ from schemas.user import (
 )
 from services.main import AppCRUD
 from utils.app_exceptions import AppException
-from utils.auth import (
-    get_hashed_password,
-    verify_password,
-    create_access_token,
-    create_refresh_token,
-)
-from utils.email import Email
-from utils.socket_managers import SocketManager, SocketChatManager
-from utils.validators import email_validator, password_validator, phone_validator
-from config.settings import SMS_API_ID, REFRESH_TOKEN_EXPIRE_MINUTES
-from models.index import Settings
+from utils.auth import create_access_token, create_refresh_token
+from utils.geo_index import master_geo_index
+from utils.mailer import MAILING_SUBJECT
+from utils.ledger import change_balance
+from utils.media import save_upload
+from utils.payments import apply_payment_status, lookup_payment
+from utils.principal import invalidate_principal
+from utils.site_settings import get_settings
+from utils.socket_managers import SocketManager
+from utils.validators import email_validator, phone_validator
+from config.settings import REFRESH_TOKEN_EXPIRE_MINUTES, MAIL_BATCH_SIZE
+from worker import send_mailing as send_mailing_task
 
 from yookassa import Payment
+from yookassa.domain.notification import WebhookNotificationFactory
 import uuid
 
 
 class UserCRUD(AppCRUD):
-    async def create_client(self, client: ClientRegister) -> dict | Exception:
+    def create_client(
+        self, client: ClientRegister, hashed_password: str
+    ) -> dict | Exception:
         is_valid_email = email_validator(client.email)
         if not is_valid_email:
             return AppException.ValidationException(detail="Некорректный e-mail!")
@@ -61,16 +69,12 @@ class UserCRUD(AppCRUD):
                 detail="Пользователь с таким номером телефона уже существует!"
             )
 
-        is_valid_password = password_validator(client.password1, client.password2)
-        if not is_valid_password:
-            return AppException.ValidationException(detail="Некорректный пароль!")
-
         user = Client(
             name=client.name,
             lastname=client.lastname,
             email=client.email,
             phone=validated_phone,
-            password=get_hashed_password(client.password1),
+            password=hashed_password,
         )
         self.db.add(user)
         self.db.commit()
@@ -79,14 +83,13 @@ class UserCRUD(AppCRUD):
         self.db.commit()
         return {"result": "Success!", "user_id": user.id}
 
-    async def send_email_verification_code(self, user: Client) -> dict | Exception:
+    def set_email_verification_code(self, user: Client) -> str | Exception:
         if user.is_email_verified:
             return AppException.AlreadyExistsException("Почта уже подтверждена!")
         code = "".join(["{}".format(randint(0, 9)) for num in range(0, 6)])
         user.email_verification_code = code
-        await Email(user, code=code, email=[user.email]).send_verification_code()
         self.db.commit()
-        return {"result": "Success!"}
+        return code
 
     def verify_email(self, user: Client, code: str) -> dict | Exception:
         if user.is_email_verified:
@@ -96,21 +99,18 @@ class UserCRUD(AppCRUD):
         user.is_email_verified = True
         user.email_verification_code = None
         self.db.commit()
+        invalidate_principal(user.id)
         return {"result": "Success!"}
 
-    async def send_phone_verification_code(
-        self, user: Client, bg_tasks: BackgroundTasks
-    ) -> dict | Exception:
+    def set_phone_verification_code(self, user: Client) -> str | Exception:
         if user.is_phone_verified:
             return AppException.AlreadyExistsException("Телефон уже подтвержден!")
+        if not SMSTransport.validate_phone(user.phone[1:]):
+            return AppException.ValidationException("Некорректный номер телефона!")
         code = "".join(["{}".format(randint(0, 9)) for num in range(0, 6)])
-        sms = SMSTransport(api_id=SMS_API_ID)
-        print(sms)
         user.phone_verification_code = code
-        print(code)
-        sms.send(user.phone[1:], f"Ваш код подтверждения: {code}")
         self.db.commit()
-        return {"result": "Success!"}
+        return code
 
     def verify_phone(self, user: Client, code: str) -> dict | Exception:
         if user.is_phone_verified:
@@ -120,21 +120,31 @@ class UserCRUD(AppCRUD):
         user.is_phone_verified = True
         user.phone_verification_code = None
         self.db.commit()
+        invalidate_principal(user.id)
         return {"result": "Success!"}
 
-    def get_jwt_tokens(self, data: OAuth2PasswordRequestForm) -> dict | Exception:
-        parsed_phone = phone_validator(data.username)
+    def get_password_by_phone(self, phone: str) -> tuple[int, str] | Exception:
+        parsed_phone = phone_validator(phone)
         if not parsed_phone:
             return AppException.ValidationException("Некорректный номер телефона!")
-        user = self.db.query(Client).filter(Client.phone == parsed_phone).first()
+        user = (
+            self.db.query(Client.id, Client.password)
+            .filter(Client.phone == parsed_phone)
+            .first()
+        )
         if user is None:
             return AppException.NotFoundException(detail="Пользователь не был найден!")
-        hashed_password = user.password
-        if not verify_password(data.password, hashed_password):
-            return AppException.ValidationException(detail="Неправильный пароль!")
+        return tuple(user)
 
+    def get_password_by_id(self, id: int) -> str | Exception:
+        password = self.db.query(Client.password).filter(Client.id == id).scalar()
+        if password is None:
+            return AppException.NotFoundException(detail="Пользователь не найден!")
+        return password
+
+    def get_jwt_tokens(self, user_id: int) -> dict | Exception:
         refresh_token_check = self.db.query(RefreshToken).filter(
-            RefreshToken.user_id == user.id
+            RefreshToken.user_id == user_id
         )
         if refresh_token_check.first():
             if (
@@ -146,11 +156,11 @@ class UserCRUD(AppCRUD):
             refresh_token_check.delete()
             self.db.commit()
 
-        access_token = create_access_token(user.id)
-        refresh_token = create_refresh_token(user.id)
+        access_token = create_access_token(user_id)
+        refresh_token = create_refresh_token(user_id)
 
         refresh_token_dict = {
-            "user_id": user.id,
+            "user_id": user_id,
             "refresh_token": refresh_token,
         }
         refresh_token_db_data = RefreshToken(**refresh_token_dict)
@@ -162,8 +172,11 @@ class UserCRUD(AppCRUD):
             "refresh_token": refresh_token,
         }
 
-    async def create_master(
-        self, id: int, master: MasterRegister | MasterIn
+    def create_master(
+        self,
+        id: int | None,
+        master: MasterRegister | MasterIn,
+        hashed_password: str | None = None,
     ) -> dict | Exception:
         if (
             self.db.query(Master)
@@ -175,7 +188,9 @@ class UserCRUD(AppCRUD):
                 detail="Пользователь с таким именем пользователя уже существует!"
             )
         if id is None:
-            client = await self.create_client(ClientRegister(**master.model_dump()))
+            client = self.create_client(
+                ClientRegister(**master.model_dump()), hashed_password
+            )
             if isinstance(client, dict):
                 id = client["user_id"]
             else:
@@ -190,6 +205,7 @@ class UserCRUD(AppCRUD):
         self.db.add(user)
         self.db.commit()
         self.db.refresh(user)
+        invalidate_principal(user.client_id)
         repair_types = list()
         for device in master.devices:
             repair_types += ServiceCRUD(self.db).get_repair_types_by_device(device)
@@ -210,6 +226,7 @@ class UserCRUD(AppCRUD):
                     address_longitude=master.address_longitude,
                 )
                 self.db.add(new_repair)
+        master_geo_index.mark_changed(self.db, user.username)
         self.db.commit()
         return {"result": "Success!"}
 
@@ -249,45 +266,15 @@ class UserCRUD(AppCRUD):
                 return AppException.ValidationException(detail="Некорректный e-mail!")
             client.is_email_verified = False
 
-        if "new_password1" in data:
-            hashed_password = client.password
-            if not verify_password(data["old_password"], hashed_password):
-                return AppException.ValidationException(detail="Неправильный пароль!")
-
-            is_valid_password = password_validator(
-                data["new_password1"], data["new_password2"]
-            )
-            if not is_valid_password:
-                return AppException.ValidationException(detail="Некорректный пароль!")
         if file:
-            if os.path.exists(f"media/files/{file.filename}"):
-                i = 1
-                paths_parts = [
-                    file.filename[: file.filename.rindex(".")],
-                    file.filename[file.filename.rindex(".") + 1 :],
-                ]
-                while os.path.exists(
-                    f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                ):
-                    i += 1
-                with open(
-                    f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                ) as f:
-                    content = file.file.read()
-                    f.write(content)
-                    file_link = f.name[6:]
-            else:
-                with open(f"media/files/{file.filename}", "wb") as f:
-                    content = file.file.read()
-                    f.write(content)
-                    file_link = f.name[6:]
-            data["avatar"] = f"{file_link}"
+            data["avatar"] = save_upload(file, image=True)
         for attr in data:
             has_attr = hasattr(client, attr)
             if has_attr:
                 setattr(client, attr, data[attr])
 
         self.db.commit()
+        invalidate_principal(client.id)
         self.db.refresh(client)
         return client
 
@@ -321,71 +308,58 @@ class UserCRUD(AppCRUD):
             if has_attr:
                 setattr(master, attr, data[attr])
         if data.get("address_latitude"):
-            master_repairs = (
-                self.db.query(MasterRepair)
-                .filter(MasterRepair.master_id == username)
-                .all()
+            self.db.query(MasterRepair).filter(
+                MasterRepair.master_id == username
+            ).update(
+                {
+                    MasterRepair.address_latitude: data.get("address_latitude"),
+                    MasterRepair.address_longitude: data.get("address_longitude"),
+                },
+                synchronize_session=False,
             )
-            for master_repair in master_repairs:
-                master_repair.address_latitude = data.get("address_latitude")
-                master_repair.address_longitude = data.get("address_longitude")
         if pictures:
             new_pictures = list()
             for file in pictures:
                 if type(file) == str:
                     new_pictures.append(file)
                     continue
-                if os.path.exists(f"media/files/{file.filename}"):
-                    i = 1
-                    paths_parts = [
-                        file.filename[: file.filename.rindex(".")],
-                        file.filename[file.filename.rindex(".") + 1 :],
-                    ]
-                    while os.path.exists(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                    ):
-                        i += 1
-                    with open(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                    ) as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                else:
-                    with open(f"media/files/{file.filename}", "wb") as f:
-                        content = file.file.read()
-                        f.write(content)
-                        link = f.name[6:]
-                new_pictures.append(link)
+                new_pictures.append(save_upload(file, image=True))
             master.pictures = new_pictures
+        if data.get("address_latitude") or "is_active" in data:
+            master_geo_index.mark_changed(self.db, username)
         self.db.commit()
         self.db.refresh(master)
         return master
 
     def get_master_by_client(self, user: Client) -> Master:
-        master = self.db.query(Master).filter(Master.client_id == user.id).first()
+        state = inspect(user)
+        if state.session is self.db and "master" not in state.unloaded:
+            master = user.master[0] if user.master else None
+        else:
+            master = self.db.query(Master).filter(Master.client_id == user.id).first()
         if not master:
             raise HTTPException(status_code=404, detail="Не удалось найти мастера!")
         return master
 
-    def notification_handler(self, data: dict, user: models.user.Client):
+    def notification_handler(
+        self,
+        data: dict,
+        user_id: int,
+        online_users: List[int] = None,
+        receiver_in_chat: bool = False,
+    ):
         new_data = None
         receiver = None
         try:
             match data.get("type"):
                 case 1:
-                    manager = SocketManager()
                     new_data = {
                         "type": 1,
-                        "online_users": list(manager.active_connections.keys()),
+                        "online_users": online_users or [],
                     }
-                    receiver = user.id
+                    receiver = user_id
                 case 2:
-                    manager = SocketChatManager()
-                    if (
-                        not (data["receiver_id"], data["dialog_id"])
-                        in manager.active_connections
-                    ):
+                    if not receiver_in_chat:
                         receiver = data["receiver_id"]
                         unread_message = (
                             self.db.query(UnreadMessage)
@@ -427,11 +401,11 @@ class UserCRUD(AppCRUD):
                             )
                         new_data = {
                             "type": 2,
-                            "sender": user.id,
+                            "sender": user_id,
                             "unread_messages": unread_messages,
                         }
                 case 3:
-                    new_data = {"type": 3, "sender": user.id, "order": data["order_id"]}
+                    new_data = {"type": 3, "sender": user_id, "order": data["order_id"]}
                     receiver = data["receiver_id"]
                     new_user = (
                         self.db.query(Client).filter(Client.id == receiver).first()
@@ -448,7 +422,7 @@ class UserCRUD(AppCRUD):
                 case 4:
                     new_data = {
                         "type": 4,
-                        "sender": user.id,
+                        "sender": user_id,
                         "request": data["request_id"],
                     }
                     receiver = data["receiver_id"]
@@ -465,7 +439,7 @@ class UserCRUD(AppCRUD):
                     self.db.add(notification)
                     self.db.commit()
                 case 5:
-                    new_data = {"type": 5, "sender": user.id, "offer": data["offer_id"]}
+                    new_data = {"type": 5, "sender": user_id, "offer": data["offer_id"]}
                     receiver = data["receiver_id"]
                     new_user = (
                         self.db.query(Client).filter(Client.id == receiver).first()
@@ -485,23 +459,28 @@ class UserCRUD(AppCRUD):
             raise AppException.ValidationException("Некорректные данные!")
         return new_data, receiver
 
-    def write_commission_off(self, master: Master, price: float) -> Master:
-        settings = self.db.query(Settings).filter(Settings.id == 1).first()
-        amount = price * settings.commission
-        if master.balance < amount:
+    def write_commission_off(
+        self, master: Master, price: float, reference: str = None
+    ) -> Master:
+        amount = price * get_settings(self.db).commission
+        if not change_balance(
+            self.db,
+            master.username,
+            -amount,
+            "commission",
+            reference,
+            allow_negative=False,
+        ):
             raise AppException.PaymentRequiredException(
                 "Недостаточно средств, пополните счет!"
             )
-        master.balance -= amount
-        self.db.commit()
         return master
 
-    def charge_commission(self, username: str, price: float) -> None:
-        master = self.db.query(Master).filter(Master.username == username).first()
-        settings = self.db.query(Settings).filter(Settings.id == 1).first()
-        amount = price * settings.commission
-        master.balance += amount
-        self.db.commit()
+    def charge_commission(
+        self, username: str, price: float, reference: str = None
+    ) -> None:
+        amount = price * get_settings(self.db).commission
+        change_balance(self.db, username, amount, "commission_refund", reference)
 
     def replenish_balance(self, master: Master, amount: float) -> dict | Exception:
         if amount <= 0:
@@ -542,17 +521,34 @@ class UserCRUD(AppCRUD):
         if payment.status == "succeeded":
             return AppException.AlreadyExistsException("Платеж уже подтвержден!")
         kassa_payment = Payment.find_one(str(payment.payment_id))
-        payment.status = kassa_payment.status
-        payment.paid = kassa_payment.paid
-        if kassa_payment.status == "succeeded":
-            master = (
-                self.db.query(Master)
-                .filter(Master.username == payment.master_username)
-                .first()
-            )
-            master.balance += payment.amount
-            payment.is_confirmed = True
-        self.db.commit()
+        apply_payment_status(
+            self.db, payment.payment_id, kassa_payment.status, kassa_payment.paid
+        )
+        return {"result": "Success"}
+
+    def handle_payment_notification(self, body: dict) -> dict | Exception:
+        try:
+            notification = WebhookNotificationFactory().create(body)
+            payment_id = uuid.UUID(notification.object.id)
+        except (TypeError, ValueError) as e:
+            return AppException.ValidationException(f"Некорректное уведомление: {e}")
+        # Refund notifications and ones about payments made elsewhere are
+        # acknowledged too, otherwise YooKassa keeps redelivering them.
+        if not notification.event.startswith("payment."):
+            return {"result": "Success"}
+        # The notification is not signed, so it only says which payment to
+        # look at; its status is taken from the YooKassa API.
+        exists = (
+            self.db.query(DBPayment.id)
+            .filter(DBPayment.payment_id == payment_id)
+            .first()
+        )
+        if not exists:
+            return {"result": "Success"}
+        result = lookup_payment(payment_id)
+        if result is None:
+            return AppException.InternalServerException("Не удалось проверить платеж!")
+        apply_payment_status(self.db, payment_id, *result)
         return {"result": "Success"}
 
     def get_unread_messages(self, user_id: int) -> List[UnreadMessage]:
@@ -563,50 +559,52 @@ class UserCRUD(AppCRUD):
         )
         return list(unread_messages)
 
-    async def send_mailing(
-        self, master_username: str, order_id: int = None, request_id: int = None
-    ) -> None:
-        if master_username == "__all__":
-            masters = (
-                self.db.query(Master)
-                .filter(Master.mailing == True, Master.is_active == True)
-                .all()
-            )
-            for master in masters:
-                if order_id:
-                    email = Email(
-                        master.client,
-                        email=[master.client.email],
-                        entity_id=order_id,
-                        type=2,
-                    )
-                    await email.send_mailing("tsarbirzzha.ru | Уведомление!")
-                elif request_id:
-                    email = Email(
-                        master.client,
-                        email=[master.client.email],
-                        entity_id=request_id,
-                        type=3,
-                    )
-                    await email.send_mailing("tsarbirzzha.ru | Уведомление!")
-            return
-
+    def get_mailing_recipients(self, master_username: str) -> List[Client]:
         master = (
             self.db.query(Master).filter(Master.username == master_username).first()
         )
-        if not master.mailing:
+        if not master or not master.mailing:
+            return []
+        return [master.client]
+
+    def get_masters_clients(self, usernames: set[str]) -> List[tuple[Client, bool]]:
+        if not usernames:
+            return []
+        rows = (
+            self.db.query(Client, Master.mailing)
+            .join(Master, Master.client_id == Client.id)
+            .filter(Master.username.in_(usernames))
+            .all()
+        )
+        return [(client, bool(mailing)) for client, mailing in rows]
+
+    def send_mailing(
+        self, recipients: List[Client], order_id: int = None, request_id: int = None
+    ) -> None:
+        if not recipients:
             return
-        if order_id:
-            email = Email(
-                master.client, email=[master.client.email], entity_id=order_id, type=2
-            )
-            await email.send_mailing("tsarbirzzha.ru | Уведомление!")
-        elif request_id:
-            email = Email(
-                master.client, email=[master.client.email], entity_id=request_id, type=3
+        deliveries = [
+            MailDelivery(
+                client_id=client.id,
+                email=client.email,
+                first_name=client.name,
+                subject=MAILING_SUBJECT,
+                type=2 if order_id else 3,
+                entity=order_id or request_id,
             )
-            await email.send_mailing("tsarbirzzha.ru | Уведомление!")
-        return
+            for client in recipients
+        ]
+        self.db.add_all(deliveries)
+        self.db.commit()
+        delivery_ids = [delivery.id for delivery in deliveries]
+        for start in range(0, len(delivery_ids), MAIL_BATCH_SIZE):
+            send_mailing_task.delay(delivery_ids[start : start + MAIL_BATCH_SIZE])
+
+    async def send_realtime(self, data: dict, receivers: List[int]) -> None:
+        manager = SocketManager()
+        online_users = set(await manager.get_online_users())
+        for receiver in set(receivers) & online_users:
+            await manager.send_direct_message(data, receiver)
 
     def get_deposit_history_by_master(self, master: Master) -> List[DBPayment]:
         payments = (
@@ -619,18 +617,14 @@ class UserCRUD(AppCRUD):
         )
         return payments
 
-    async def recover_password(self, data: RecoverPasswordIn) -> dict | Exception:
+    def set_password_recovery_code(self, data: RecoverPasswordIn) -> Client | Exception:
         user = self.db.query(Client).filter(Client.phone == data.phone).first()
         if not user:
             return AppException.NotFoundException("Пользователь не найден!")
         code = "".join(["{}".format(randint(0, 9)) for num in range(0, 6)])
-
-        await Email(user, [user.email], code).send_password_recovery_code(
-            "Восстановление пароля TsarBirzzha"
-        )
         user.password_recovery_code = code
         self.db.commit()
-        return {"result": "Success!", "user_id": user.id}
+        return user
 
     def verify_password_recovery(self, code: str, user_id: int) -> dict | Exception:
         user = self.db.query(Client).filter(Client.id == user_id).first()
@@ -640,22 +634,24 @@ class UserCRUD(AppCRUD):
             return AppException.ValidationException("Неправильный код подтверждения!")
         return {"result": "Success!"}
 
-    def change_password(self, data: ChangePasswordIn) -> dict | Exception:
+    def change_password(
+        self, data: ChangePasswordIn, hashed_password: str
+    ) -> dict | Exception:
         user = self.db.query(Client).filter(Client.id == data.user_id).first()
         if not user:
             return AppException.NotFoundException("Пользователь не найден!")
         if user.password_recovery_code != data.code:
             return AppException.ValidationException("Неправильный код подтверждения!")
-        if not password_validator(data.password):
-            return AppException.ValidationException(
-                "Пароль не удовлетворяет требованиям!"
-            )
-        user.password = get_hashed_password(data.password)
+        user.password = hashed_password
         user.password_recovery_code = None
         self.db.commit()
         return {"result": "Success!"}
 
     def delete_account(self, user: Client) -> dict:
+        user_id = user.id
+        for master in user.master:
+            master_geo_index.mark_changed(self.db, master.username)
         self.db.delete(user)
         self.db.commit()
+        invalidate_principal(user_id)
         return {"result": "Success!"}
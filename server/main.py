@@ -1,3 +1,5 @@
+import asyncio
+
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import FileResponse
 
@@ -7,6 +9,7 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from routers import user, service, submission, index, chat, websockets
 from config.database import create_tables
+from config.settings import VIEW_COUNTER
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from utils.request_exceptions import (
@@ -16,6 +19,9 @@ from utils.request_exceptions import (
 from utils.app_exceptions import app_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
 from admin import admin
+from utils.auth import shutdown_hash_executor
+from utils.phone import close_sms_client
+from utils.views import flush_views_once, run_view_flusher
 
 create_tables()
 
@@ -33,6 +39,31 @@ class SpaMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(SpaMiddleware)
 
+
+@app.on_event("startup")
+async def start_view_flusher():
+    # With the Redis counter the flush runs as a beat task in the worker.
+    if VIEW_COUNTER == "memory":
+        app.state.view_flusher = asyncio.create_task(run_view_flusher())
+
+
+@app.on_event("shutdown")
+async def stop_view_flusher():
+    if VIEW_COUNTER == "memory":
+        app.state.view_flusher.cancel()
+        await asyncio.to_thread(flush_views_once)
+
+
+@app.on_event("shutdown")
+async def stop_sms_client():
+    await close_sms_client()
+
+
+@app.on_event("shutdown")
+async def stop_hash_executor():
+    await asyncio.to_thread(shutdown_hash_executor)
+
+
 myadmin = FastAPI()
 
 
@@ -49,3 +49,17 @@ class Dialog(Base):
 
     async def __admin_repr__(self, request: Request):
         return f'{self.sender1.name} {self.sender1.lastname} - {self.sender2.name} {self.sender2.lastname}'
+
+
+class Attachment(Base):
+    __tablename__ = 'attachment'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    uploader_id = Column(Integer, ForeignKey('client.id', ondelete='CASCADE'), nullable=False)
+    uploader: Mapped['Client'] = relationship('Client')
+    name = Column(String, nullable=False)
+    file = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+    async def __admin_repr__(self, request: Request):
+        return self.name
@@ -74,3 +74,19 @@ class ArticleComment(Base):
     likes = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.datetime.now)
 
+
+
+class CacheVersion(Base):
+    __tablename__ = 'cache_version'
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class GeoIndexChange(Base):
+    __tablename__ = 'geo_index_change'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # None means anything may have changed and the index is rebuilt in full.
+    master_id = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now, index=True)
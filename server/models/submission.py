@@ -8,7 +8,7 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     DateTime,
-    Boolean, PickleType
+    Boolean, PickleType, Index, DDL, event
 )
 from starlette.requests import Request
 from sqlalchemy.orm import relationship
@@ -19,6 +19,8 @@ from typing import List
 from sqlalchemy.types import ARRAY
 from sqlalchemy.ext.mutable import MutableList
 
+SEARCH_CONFIG = 'russian'
+
 
 class StatusEnum(str, enum.Enum):
     active = 'Активно'
@@ -47,6 +49,10 @@ class Order(Base):
     master_message = Column(Text, nullable=True)
     master_time = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index('ix_order_client_created_at_id', client_id, created_at.desc(), id.desc()),
+    )
+
     async def __admin_repr__(self, request: Request):
         return f'Заказ №{self.id}'
 
@@ -69,11 +75,35 @@ class ServiceRequest(Base):
     expires_at = Column(DateTime, nullable=True)
     number_of_offers = Column(Integer, default=0)
     views = Column(Integer, default=0)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('ix_service_request_created_at_id', created_at.desc(), id.desc()),
+        Index('ix_service_request_client_created_at_id', client_id, created_at.desc(), id.desc()),
+        Index('ix_service_request_type_status_created_at', service_type_id, status, created_at.desc(), id.desc()),
+        Index('ix_service_request_status_price', status, client_price),
+        Index('ix_service_request_location', latitude, longitude),
+        Index('ix_service_request_status_expires_at', status, expires_at),
+    )
 
     async def __admin_repr__(self, request: Request):
         return self.title
 
 
+# The full-text index is Postgres-only, so it is attached as DDL instead of an
+# Index in __table_args__. It runs after every create_all, so databases created
+# before the index existed get it too.
+event.listen(
+    Base.metadata,
+    'after_create',
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_service_request_search ON service_request "
+        f"USING gin (to_tsvector('{SEARCH_CONFIG}', title || ' ' || description))"
+    ).execute_if(dialect='postgresql'),
+)
+
+
 # noinspection PyUnresolvedReferences
 class Offer(Base):
     __tablename__ = 'offer'
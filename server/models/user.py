@@ -13,6 +13,7 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     DateTime, PickleType,
+    Index,
 
 )
 import enum
@@ -139,4 +140,43 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.now)
     description = Column(String, nullable=True)
     is_confirmed = Column(Boolean, default=False)
+    check_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_check_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_payment_status_next_check_at", "status", "next_check_at"),
+    )
+
+
+
+class MailDelivery(Base):
+    __tablename__ = "mail_delivery"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    client_id = Column(Integer, ForeignKey("client.id", ondelete="SET NULL"), nullable=True)
+    email = Column(String, nullable=False)
+    first_name = Column(String, nullable=True)
+    subject = Column(String, nullable=False)
+    type = Column(Integer, nullable=False)
+    entity = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class BalanceLedger(Base):
+    __tablename__ = "balance_ledger"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    master_username = Column(String, ForeignKey("master.username", ondelete="CASCADE"), nullable=False)
+    amount = Column(Float, nullable=False)
+    balance_after = Column(Float, nullable=False)
+    reason = Column(String, nullable=False)
+    reference = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_balance_ledger_master_username_id", "master_username", "id"),
+    )
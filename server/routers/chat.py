@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, UploadFile
 
-from schemas.chat import Dialog, DialogIn, Message, UnreadMessage
+from schemas.chat import Dialog, DialogIn, Message, UnreadMessage, Attachment
 from services.chat import DialogService, MessageService
-from utils.dependencies import get_current_user, is_user_active
+from utils.dependencies import get_principal, is_user_active
+from utils.principal import Principal
 from utils.service_result import handle_result
-from config.database import get_db
+from config.database import get_session
+from services.main import run_service
 from typing import List
 
 router = APIRouter(
@@ -17,29 +19,67 @@ router = APIRouter(
 @router.post("/dialog", response_model=Dialog)
 async def create_dialog(
     data: DialogIn,
-    user=Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = DialogService(db).create_dialog(data, user.id)
+    result = await run_service(
+        DialogService(db).create_dialog,
+        data,
+        principal.client_id,
+        response_model=Dialog,
+    )
     return handle_result(result)
 
 
 @router.get("/dialogs", response_model=List[Dialog])
-async def get_dialogs(user=Depends(get_current_user), db: get_db = Depends()):
-    result = DialogService(db).get_dialogs(user.id)
+async def get_dialogs(
+    principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        DialogService(db).get_dialogs, principal.client_id, response_model=List[Dialog]
+    )
     return handle_result(result)
 
 
 @router.get("/messages/{dialog_id}", response_model=List[Message])
 async def get_messages(
-    dialog_id: int, user=Depends(get_current_user), db: get_db = Depends()
+    dialog_id: int,
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
 ):
-    result = MessageService(db).get_messages(dialog_id, user.id)
+    result = await run_service(
+        MessageService(db).get_messages,
+        dialog_id,
+        principal.client_id,
+        response_model=List[Message],
+    )
     return handle_result(result)
 
 
 @router.get("/messages/unread", response_model=List[UnreadMessage])
-async def get_unread_messages(user=Depends(get_current_user), db: get_db = Depends()):
-    result = DialogService(db).get_unread_messages(user.id)
+async def get_unread_messages(
+    principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        DialogService(db).get_unread_messages,
+        principal.client_id,
+        response_model=List[UnreadMessage],
+    )
+    return handle_result(result)
+
+
+@router.post("/attachment", response_model=Attachment)
+async def create_attachment(
+    file: UploadFile,
+    principal: Principal = Depends(get_principal),
+    is_active=Depends(is_user_active),
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        MessageService(db).create_attachment,
+        file,
+        principal.client_id,
+        response_model=Attachment,
+    )
     return handle_result(result)
@@ -16,12 +16,13 @@ from services.index import (
     CityService,
     CounterService,
 )
-from utils.dependencies import get_current_user
+from utils.dependencies import get_current_user, get_principal
+from utils.principal import Principal
 from utils.service_result import handle_result
-from config.database import get_db
+from config.database import get_session
+from services.main import run_service
 from typing import List
 
-
 router = APIRouter(
     prefix="/index",
     tags=["main-page"],
@@ -30,64 +31,80 @@ router = APIRouter(
 
 
 @router.get("/article/{id}", response_model=Article)
-async def get_article(id: int, db: get_db = Depends()):
-    result = ArticleService(db).get_article(id)
+async def get_article(id: int, db: get_session = Depends()):
+    result = await run_service(
+        ArticleService(db).get_article, id, response_model=Article
+    )
     return handle_result(result)
 
 
 @router.get("/articles", response_model=List[Article])
-async def get_articles(db: get_db = Depends()):
-    result = ArticleService(db).get_articles()
+async def get_articles(db: get_session = Depends()):
+    result = await run_service(
+        ArticleService(db).get_articles, response_model=List[Article]
+    )
     return handle_result(result)
 
 
 @router.patch("/article/{id}/like", response_model=str)
-async def like_article(id: int, user=Depends(get_current_user), db: get_db = Depends()):
-    result = ArticleService(db).like_article(id, user.id)
+async def like_article(
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        ArticleService(db).like_article, id, principal.client_id, response_model=str
+    )
     return handle_result(result)
 
 
 @router.patch("/article/{id}/dislike", response_model=str)
 async def dislike_article(
-    id: int, user=Depends(get_current_user), db: get_db = Depends()
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
 ):
-    result = ArticleService(db).dislike_article(id, user.id)
+    result = await run_service(
+        ArticleService(db).dislike_article, id, principal.client_id, response_model=str
+    )
     return handle_result(result)
 
 
 @router.post("/review", response_model=Review)
-async def create_review(data: ReviewIn, db: get_db = Depends()):
-    result = ReviewService(db).create_review(data)
+async def create_review(data: ReviewIn, db: get_session = Depends()):
+    result = await run_service(
+        ReviewService(db).create_review, data, response_model=Review
+    )
     return handle_result(result)
 
 
 @router.get("/review/{id}", response_model=Review)
-async def get_review(id: int, db: get_db = Depends()):
-    result = ReviewService(db).get_review(id)
+async def get_review(id: int, db: get_session = Depends()):
+    result = await run_service(ReviewService(db).get_review, id, response_model=Review)
     return handle_result(result)
 
 
 @router.get("/reviews", response_model=List[Review])
-async def get_reviews(db: get_db = Depends()):
-    result = ReviewService(db).get_reviews()
+async def get_reviews(db: get_session = Depends()):
+    result = await run_service(
+        ReviewService(db).get_reviews, response_model=List[Review]
+    )
     return handle_result(result)
 
 
 @router.get("/cover-pictures", response_model=List[CoverPicture])
-async def get_cover_pictures(db: get_db = Depends()):
-    result = CoverPictureService(db).get_cover_pictures()
+async def get_cover_pictures(db: get_session = Depends()):
+    result = await run_service(
+        CoverPictureService(db).get_cover_pictures, response_model=List[CoverPicture]
+    )
     return handle_result(result)
 
 
 @router.get("/cities", response_model=List[City])
-async def get_cities(db: get_db = Depends()):
-    result = CityService(db).get_cities()
+async def get_cities(db: get_session = Depends()):
+    result = await run_service(CityService(db).get_cities, response_model=List[City])
     return handle_result(result)
 
 
 @router.get("/counters", response_model=Counters)
-async def get_counters(db: get_db = Depends()):
-    result = CounterService(db).get_counters()
+async def get_counters(db: get_session = Depends()):
+    result = await run_service(CounterService(db).get_counters, response_model=Counters)
     return handle_result(result)
 
 
@@ -96,27 +113,41 @@ async def create_article_comment(
     id: int,
     data: ArticleCommentIn,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = ArticleService(db).create_article_comment(id, data, user)
+    result = await run_service(
+        ArticleService(db).create_article_comment,
+        id,
+        data,
+        user,
+        response_model=ArticleComment,
+    )
     return handle_result(result)
 
 
 @router.get("/article/{id}/comments", response_model=List[ArticleComment])
-async def get_comments_by_article(id: int, db: get_db = Depends()):
-    result = ArticleService(db).get_comments_by_article(id)
+async def get_comments_by_article(id: int, db: get_session = Depends()):
+    result = await run_service(
+        ArticleService(db).get_comments_by_article,
+        id,
+        response_model=List[ArticleComment],
+    )
     return handle_result(result)
 
 
 @router.post("/article/comment/{id}/like")
-async def like_comment(id: int, user=Depends(get_current_user), db: get_db = Depends()):
-    result = ArticleService(db).like_comment(id, user)
+async def like_comment(
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(ArticleService(db).like_comment, id, principal.client_id)
     return handle_result(result)
 
 
 @router.delete("/article/comment/{id}/dislike")
 async def dislike_comment(
-    id: int, user=Depends(get_current_user), db: get_db = Depends()
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
 ):
-    result = ArticleService(db).dislike_comment(id, user)
+    result = await run_service(
+        ArticleService(db).dislike_comment, id, principal.client_id
+    )
     return handle_result(result)
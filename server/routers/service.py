@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from services.service import (
     ServiceTypeService,
     DeviceService,
@@ -15,11 +15,20 @@ from schemas.service import (
     AllServices,
     RepairTypeIn,
     RepairTypeEdit,
+    NearbyMasterRepair,
+    MapCluster,
 )
-from utils.dependencies import get_current_user
+from utils.dependencies import get_current_user, get_principal
+from utils.principal import Principal
 from utils.service_result import handle_result
-from config.database import get_db
-from typing import List
+from config.database import get_session
+from services.main import run_in_session, run_service
+from utils.catalog import get_catalog
+from utils.clusters import MAX_ZOOM
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import List, Optional
+
+MAX_NEARBY_RADIUS = 100
 
 router = APIRouter(
     prefix="/service",
@@ -28,77 +37,132 @@ router = APIRouter(
 )
 
 
+async def check_catalog_etag(
+    request: Request, response: Response, db
+) -> Response | None:
+    catalog = await run_in_session(db, get_catalog)
+    if_none_match = request.headers.get("if-none-match", "")
+    etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+    if catalog.etag in etags or "*" in etags:
+        return Response(status_code=304, headers={"ETag": catalog.etag})
+    response.headers["ETag"] = catalog.etag
+    return None
+
+
 @router.get("/type/{id}", response_model=ServiceType)
-async def get_service_type(id: int, db: get_db = Depends()):
-    result = ServiceTypeService(db).get_service_type(id)
+async def get_service_type(id: int, db: get_session = Depends()):
+    result = await run_service(
+        ServiceTypeService(db).get_service_type, id, response_model=ServiceType
+    )
     return handle_result(result)
 
 
 @router.get("/types/{category_id}", response_model=List[ServiceType])
-async def get_service_types_by_category(category_id: int, db: get_db = Depends()):
-    result = ServiceTypeService(db).get_service_types_by_category(category_id)
+async def get_service_types_by_category(category_id: int, db: get_session = Depends()):
+    result = await run_service(
+        ServiceTypeService(db).get_service_types_by_category,
+        category_id,
+        response_model=List[ServiceType],
+    )
     return handle_result(result)
 
 
 @router.get("/types", response_model=List[ServiceType])
-async def get_service_types(db: get_db = Depends()):
-    result = ServiceTypeService(db).get_service_types()
+async def get_service_types(
+    request: Request, response: Response, db: get_session = Depends()
+):
+    if not_modified := await check_catalog_etag(request, response, db):
+        return not_modified
+    result = await run_service(
+        ServiceTypeService(db).get_service_types, response_model=List[ServiceType]
+    )
     return handle_result(result)
 
 
 @router.get("/device/{id}", response_model=Device)
-async def get_device(id: int, db: get_db = Depends()):
-    result = DeviceService(db).get_device(id)
+async def get_device(id: int, db: get_session = Depends()):
+    result = await run_service(DeviceService(db).get_device, id, response_model=Device)
     return handle_result(result)
 
 
 @router.get("/devices", response_model=List[Device])
-async def get_devices(db: get_db = Depends()):
-    result = DeviceService(db).get_devices()
+async def get_devices(db: get_session = Depends()):
+    result = await run_service(
+        DeviceService(db).get_devices, response_model=List[Device]
+    )
     return handle_result(result)
 
 
 @router.get("/devices/{service_type_id}", response_model=List[Device])
-async def get_devices_by_service_type(service_type_id: int, db: get_db = Depends()):
-    result = DeviceService(db).get_devices_by_service_type(service_type_id)
+async def get_devices_by_service_type(
+    service_type_id: int,
+    request: Request,
+    response: Response,
+    db: get_session = Depends(),
+):
+    if not_modified := await check_catalog_etag(request, response, db):
+        return not_modified
+    result = await run_service(
+        DeviceService(db).get_devices_by_service_type,
+        service_type_id,
+        response_model=List[Device],
+    )
     return handle_result(result)
 
 
 @router.get("/category/{id}", response_model=Category)
-async def get_category(id: int, db: get_db = Depends()):
-    result = CategoryService(db).get_category(id)
+async def get_category(id: int, db: get_session = Depends()):
+    result = await run_service(
+        CategoryService(db).get_category, id, response_model=Category
+    )
     return handle_result(result)
 
 
 @router.get("/categories", response_model=List[Category])
-async def get_categories(db: get_db = Depends()):
-    result = CategoryService(db).get_categories()
+async def get_categories(db: get_session = Depends()):
+    result = await run_service(
+        CategoryService(db).get_categories, response_model=List[Category]
+    )
     return handle_result(result)
 
 
 @router.post("/repair_type", response_model=RepairType)
 async def create_repair_type(
-    data: RepairTypeIn, user=Depends(get_current_user), db: get_db = Depends()
+    data: RepairTypeIn, user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = RepairTypeService(db).create_repair_type(data, user)
+    result = await run_service(
+        RepairTypeService(db).create_repair_type, data, user, response_model=RepairType
+    )
     return handle_result(result)
 
 
 @router.get("/repair_type/{id}", response_model=RepairType)
-async def get_repair_type(id: int, db: get_db = Depends()):
-    result = RepairTypeService(db).get_repair_type(id)
+async def get_repair_type(id: int, db: get_session = Depends()):
+    result = await run_service(
+        RepairTypeService(db).get_repair_type, id, response_model=RepairType
+    )
     return handle_result(result)
 
 
 @router.get("/repair_types", response_model=List[RepairType])
-async def get_repair_types(db: get_db = Depends()):
-    result = RepairTypeService(db).get_repair_types()
+async def get_repair_types(db: get_session = Depends()):
+    result = await run_service(
+        RepairTypeService(db).get_repair_types, response_model=List[RepairType]
+    )
     return handle_result(result)
 
 
 @router.get("/repair_types/{device_id}", response_model=List[RepairType])
-async def get_repair_types_by_device(device_id: int, db: get_db = Depends()):
-    result = RepairTypeService(db).get_repair_types_by_device(device_id)
+async def get_repair_types_by_device(
+    device_id: int, request: Request, response: Response, db: get_session = Depends()
+):
+    if not_modified := await check_catalog_etag(request, response, db):
+        return not_modified
+    result = await run_service(
+        RepairTypeService(db).get_repair_types_by_device,
+        device_id,
+        response_model=List[RepairType],
+    )
     return handle_result(result)
 
 
@@ -107,9 +171,15 @@ async def patch_repair_type(
     id: int,
     data: RepairTypeEdit,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = RepairTypeService(db).patch_repair_type(id, data, user)
+    result = await run_service(
+        RepairTypeService(db).patch_repair_type,
+        id,
+        data,
+        user,
+        response_model=RepairType,
+    )
     return handle_result(result)
 
 
@@ -118,35 +188,103 @@ async def patch_master_repair(
     repair_id: int,
     data: MasterRepairEdit,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = RepairTypeService(db).patch_master_repair(repair_id, data, user)
+    result = await run_service(
+        RepairTypeService(db).patch_master_repair,
+        repair_id,
+        data,
+        user,
+        response_model=MasterRepair,
+    )
     return handle_result(result)
 
 
 @router.get("/master-repairs", response_model=List[MasterRepair])
-async def get_master_repairs(master_username: str = None, db: get_db = Depends()):
-    result = RepairTypeService(db).get_master_repairs(master_username)
+async def get_master_repairs(master_username: str = None, db: get_session = Depends()):
+    result = await run_service(
+        RepairTypeService(db).get_master_repairs,
+        master_username,
+        response_model=List[MasterRepair],
+    )
+    return handle_result(result)
+
+
+@router.get("/master-repairs/nearby", response_model=List[NearbyMasterRepair])
+async def get_nearby_master_repairs(
+    repair_id: int,
+    latitude: float = Query(ge=-90, le=90),
+    longitude: float = Query(ge=-180, le=180),
+    radius: float = Query(10, gt=0, le=MAX_NEARBY_RADIUS),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        RepairTypeService(db).get_nearby_master_repairs,
+        repair_id,
+        latitude,
+        longitude,
+        radius,
+        limit,
+        response_model=List[NearbyMasterRepair],
+    )
+    return handle_result(result)
+
+
+@router.get("/master-repairs/clusters", response_model=List[MapCluster])
+async def get_master_clusters(
+    min_lat: float = Query(ge=-90, le=90),
+    min_lon: float = Query(ge=-180, le=180),
+    max_lat: float = Query(ge=-90, le=90),
+    max_lon: float = Query(ge=-180, le=180),
+    zoom: int = Query(ge=0, le=MAX_ZOOM),
+    repair_id: Optional[int] = None,
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        RepairTypeService(db).get_master_clusters,
+        min_lat,
+        min_lon,
+        max_lat,
+        max_lon,
+        zoom,
+        repair_id,
+        response_model=List[MapCluster],
+    )
     return handle_result(result)
 
 
 @router.delete("/master-repair/{repair_id}")
 async def delete_master_repair(
-    repair_id: int, user=Depends(get_current_user), db: get_db = Depends()
+    repair_id: int, user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = RepairTypeService(db).delete_master_repair(repair_id, user)
+    result = await run_service(
+        RepairTypeService(db).delete_master_repair, repair_id, user
+    )
     return handle_result(result)
 
 
 @router.get("/master-services/{master_username}", response_model=AllServices)
 async def get_master_services(
-    master_username: str, user=Depends(get_current_user), db: get_db = Depends()
+    master_username: str,
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
 ):
-    result = RepairTypeService(db).get_master_services(master_username)
+    result = await run_service(
+        RepairTypeService(db).get_master_services,
+        master_username,
+        response_model=AllServices,
+    )
     return handle_result(result)
 
 
 @router.get("/services", response_model=AllServices)
-async def get_all_services(db: get_db = Depends()):
-    result = RepairTypeService(db).get_all_services()
+async def get_all_services(
+    request: Request, response: Response, db: get_session = Depends()
+):
+    if not_modified := await check_catalog_etag(request, response, db):
+        return not_modified
+    result = await run_service(
+        RepairTypeService(db).get_all_services, response_model=AllServices
+    )
     return handle_result(result)
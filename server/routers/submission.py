@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, UploadFile
+from fastapi import APIRouter, Depends, Query, UploadFile
 from starlette.background import BackgroundTasks
 
 from models import StatusEnum
@@ -15,6 +15,7 @@ from schemas.submission import (
     RequestIn,
     Request,
     RequestEdit,
+    RequestSearch,
     Offer,
     OfferIn,
     OfferEdit,
@@ -22,15 +23,20 @@ from schemas.submission import (
     FeedbackIn,
     FeedbackEdit,
 )
+from schemas.pagination import Page
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from utils.service_result import handle_result
-from config.database import get_db
-from typing import List
+from config.database import get_session
+from services.main import run_service
+from typing import List, Optional
 from utils.dependencies import (
     get_current_user,
+    get_principal,
     request_checker,
     is_user_active,
     feedback_checker,
 )
+from utils.principal import Principal
 
 router = APIRouter(
     prefix="/submission",
@@ -45,27 +51,46 @@ async def create_order(
     bg_tasks: BackgroundTasks,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = await OrderService(db).create_order(data, user, bg_tasks)
+    result = await run_service(
+        OrderService(db).create_order, data, user, bg_tasks, response_model=Order
+    )
     return handle_result(result)
 
 
 @router.get("/order/{id}", response_model=Order)
-async def get_order(id: int, user=Depends(get_current_user), db: get_db = Depends()):
-    result = OrderService(db).get_order(id)
+async def get_order(
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(OrderService(db).get_order, id, response_model=Order)
     return handle_result(result)
 
 
-@router.get("/orders/client", response_model=List[Order])
-async def get_orders_by_client(user=Depends(get_current_user), db: get_db = Depends()):
-    result = OrderService(db).get_orders_by_client(user.id)
+@router.get("/orders/client", response_model=Page[Order])
+async def get_orders_by_client(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        OrderService(db).get_orders_by_client,
+        principal.client_id,
+        cursor,
+        limit,
+        response_model=Page[Order],
+    )
     return handle_result(result)
 
 
 @router.get("/orders/master", response_model=List[Order])
-async def get_orders_by_master(user=Depends(get_current_user), db: get_db = Depends()):
-    result = OrderService(db).get_orders_by_master(user)
+async def get_orders_by_master(
+    user=Depends(get_current_user), db: get_session = Depends()
+):
+    result = await run_service(
+        OrderService(db).get_orders_by_master, user, response_model=List[Order]
+    )
     return handle_result(result)
 
 
@@ -75,9 +100,11 @@ async def patch_order(
     data: OrderEdit,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OrderService(db).patch_order(id, data, user)
+    result = await run_service(
+        OrderService(db).patch_order, id, data, user, response_model=Order
+    )
     return handle_result(result)
 
 
@@ -87,9 +114,11 @@ async def finish_order(
     status: StatusEnum,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OrderService(db).finish_order(id, status, user)
+    result = await run_service(
+        OrderService(db).finish_order, id, status, user, response_model=dict
+    )
     return handle_result(result)
 
 
@@ -98,9 +127,9 @@ async def delete_order(
     id: int,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OrderService(db).delete_order(id, user)
+    result = await run_service(OrderService(db).delete_order, id, user)
     return handle_result(result)
 
 
@@ -111,37 +140,89 @@ async def create_request(
     files: List[UploadFile] = None,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = await RequestService(db).create_request(data, user, bg_tasks, files)
+    result = await run_service(
+        RequestService(db).create_request,
+        data,
+        user,
+        bg_tasks,
+        files,
+        response_model=Request,
+    )
     return handle_result(result)
 
 
 @router.get("/request/{id}", response_model=Request)
-async def get_request(id: int, user=Depends(get_current_user), db: get_db = Depends()):
-    result = RequestService(db).get_request(id)
+async def get_request(
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        RequestService(db).get_request, id, response_model=Request
+    )
+    return handle_result(result)
+
+
+@router.get("/requests", response_model=Page[Request])
+async def get_requests(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        RequestService(db).get_requests,
+        principal.client_id,
+        cursor,
+        limit,
+        response_model=Page[Request],
+    )
     return handle_result(result)
 
 
-@router.get("/requests", response_model=List[Request])
-async def get_requests(user=Depends(get_current_user), db: get_db = Depends()):
-    result = RequestService(db).get_requests(user.id)
+@router.get("/requests/search", response_model=Page[Request])
+async def search_requests(
+    search: RequestSearch = Depends(),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
+):
+    result = await run_service(
+        RequestService(db).search_requests,
+        principal.client_id,
+        search,
+        cursor,
+        limit,
+        response_model=Page[Request],
+    )
     return handle_result(result)
 
 
 @router.get("/requests/master", response_model=List[Request])
 async def get_requests_by_master(
-    user=Depends(get_current_user), db: get_db = Depends()
+    user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = RequestService(db).get_requests_by_master(user)
+    result = await run_service(
+        RequestService(db).get_requests_by_master, user, response_model=List[Request]
+    )
     return handle_result(result)
 
 
-@router.get("/requests/client", response_model=List[Request])
+@router.get("/requests/client", response_model=Page[Request])
 async def get_requests_by_client(
-    user=Depends(get_current_user), db: get_db = Depends()
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
 ):
-    result = RequestService(db).get_requests_by_client_id(user.id)
+    result = await run_service(
+        RequestService(db).get_requests_by_client_id,
+        principal.client_id,
+        cursor,
+        limit,
+        response_model=Page[Request],
+    )
     return handle_result(result)
 
 
@@ -149,11 +230,17 @@ async def get_requests_by_client(
 async def patch_request(
     id: int,
     data: RequestEdit,
-    user=Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = RequestService(db).patch_request(id, data, user.id)
+    result = await run_service(
+        RequestService(db).patch_request,
+        id,
+        data,
+        principal.client_id,
+        response_model=Request,
+    )
     return handle_result(result)
 
 
@@ -163,20 +250,24 @@ async def complete_request(
     status: StatusEnum,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = RequestService(db).complete_request(id, user, status)
+    result = await run_service(
+        RequestService(db).complete_request, id, user, status, response_model=dict
+    )
     return handle_result(result)
 
 
 @router.delete("/request/{id}")
 async def delete_request(
     id: int,
-    user=Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = RequestService(db).delete_request(id, user.id)
+    result = await run_service(
+        RequestService(db).delete_request, id, principal.client_id
+    )
     return handle_result(result)
 
 
@@ -185,31 +276,45 @@ async def create_offer(
     data: OfferIn,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OfferService(db).create_offer(data, user)
+    result = await run_service(
+        OfferService(db).create_offer, data, user, response_model=Offer
+    )
     return handle_result(result)
 
 
 @router.get("/offer", response_model=Offer)
 async def get_offer(
-    request_id: int, user=Depends(get_current_user), db: get_db = Depends()
+    request_id: int, user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = OfferService(db).get_offer(request_id, user)
+    result = await run_service(
+        OfferService(db).get_offer, request_id, user, response_model=Offer
+    )
     return handle_result(result)
 
 
 @router.get("/offers", response_model=List[Offer])
 async def get_offers_by_submission(
-    request_id: int, user=Depends(get_current_user), db: get_db = Depends()
+    request_id: int,
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
 ):
-    result = OfferService(db).get_offers_by_submission(request_id)
+    result = await run_service(
+        OfferService(db).get_offers_by_submission,
+        request_id,
+        response_model=List[Offer],
+    )
     return handle_result(result)
 
 
 @router.get("/offers/master", response_model=List[Offer])
-async def get_offers_by_master(user=Depends(get_current_user), db: get_db = Depends()):
-    result = OfferService(db).get_offers_by_master(user)
+async def get_offers_by_master(
+    user=Depends(get_current_user), db: get_session = Depends()
+):
+    result = await run_service(
+        OfferService(db).get_offers_by_master, user, response_model=List[Offer]
+    )
     return handle_result(result)
 
 
@@ -219,9 +324,11 @@ async def patch_offer(
     data: OfferEdit,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OfferService(db).patch_offer(id, data, user)
+    result = await run_service(
+        OfferService(db).patch_offer, id, data, user, response_model=Offer
+    )
     return handle_result(result)
 
 
@@ -230,9 +337,11 @@ async def accept_offer(
     id: int,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OfferService(db).accept_offer(id, user)
+    result = await run_service(
+        OfferService(db).accept_offer, id, user, response_model=dict
+    )
     return handle_result(result)
 
 
@@ -241,9 +350,11 @@ async def delete_offer(
     id: int,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = OfferService(db).delete_offer(id, user)
+    result = await run_service(
+        OfferService(db).delete_offer, id, user, response_model=Offer
+    )
     return handle_result(result)
 
 
@@ -251,11 +362,17 @@ async def delete_offer(
 async def create_feedback(
     data: FeedbackIn = Depends(feedback_checker),
     pictures: List[UploadFile] = None,
-    user=Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = FeedbackService(db).create_feedback(data, user.id, pictures)
+    result = await run_service(
+        FeedbackService(db).create_feedback,
+        data,
+        principal.client_id,
+        pictures,
+        response_model=Feedback,
+    )
     return handle_result(result)
 
 
@@ -264,15 +381,25 @@ async def get_feedback(
     offer_id: int = None,
     order_id: int = None,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = FeedbackService(db).get_feedback(offer_id, order_id, user)
+    result = await run_service(
+        FeedbackService(db).get_feedback,
+        offer_id,
+        order_id,
+        user,
+        response_model=Feedback,
+    )
     return handle_result(result)
 
 
 @router.get("/feedbacks/{master_username}", response_model=List[Feedback])
-async def get_feedbacks(master_username: str, db: get_db = Depends()):
-    result = FeedbackService(db).get_feedbacks(master_username)
+async def get_feedbacks(master_username: str, db: get_session = Depends()):
+    result = await run_service(
+        FeedbackService(db).get_feedbacks,
+        master_username,
+        response_model=List[Feedback],
+    )
     return handle_result(result)
 
 
@@ -282,18 +409,22 @@ async def patch_feedback(
     data: FeedbackEdit,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = FeedbackService(db).patch_feedback(id, data, user)
+    result = await run_service(
+        FeedbackService(db).patch_feedback, id, data, user, response_model=Feedback
+    )
     return handle_result(result)
 
 
 @router.delete("/feedback/{id}")
 async def delete_feedback(
     id: int,
-    user=Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = FeedbackService(db).delete_feedback(id, user.id)
+    result = await run_service(
+        FeedbackService(db).delete_feedback, id, principal.client_id
+    )
     return handle_result(result)
@@ -1,7 +1,9 @@
 import uuid
 
-from fastapi import APIRouter, Depends, UploadFile, BackgroundTasks
+from fastapi import APIRouter, Depends, UploadFile, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from netaddr import AddrFormatError
+from yookassa.domain.common import SecurityHelper
 
 from services.user import ClientService, UserService, MasterService
 from schemas.user import (
@@ -23,11 +25,16 @@ from schemas.user import (
 from utils.service_result import handle_result
 from utils.dependencies import (
     get_current_user,
+    get_principal,
     client_checker,
     user_checker,
     is_user_active,
 )
-from config.database import get_db
+from utils.principal import Principal
+from config.database import get_session
+from config.settings import YOOKASSA_WEBHOOK_CHECK_IP
+from utils.app_exceptions import AppException
+from services.main import run_in_session, run_service
 from typing import Union, List
 
 router = APIRouter(
@@ -38,28 +45,30 @@ router = APIRouter(
 
 
 @router.post("/register/client")
-async def create_client(client: ClientRegister, db: get_db = Depends()):
-    result = await ClientService(db).create_client(client)
+async def create_client(client: ClientRegister, db: get_session = Depends()):
+    result = await ClientService(db).register_client(client)
     return handle_result(result)
 
 
 @router.post("/email/send")
-async def send_email_code(user=Depends(get_current_user), db: get_db = Depends()):
+async def send_email_code(user=Depends(get_current_user), db: get_session = Depends()):
     result = await ClientService(db).send_email_code(user)
     return handle_result(result)
 
 
 @router.get("/email/verify/{code}")
 async def verify_email(
-    code: str, user=Depends(get_current_user), db: get_db = Depends()
+    code: str, user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = ClientService(db).verify_email(user, code)
+    result = await run_service(ClientService(db).verify_email, user, code)
     return handle_result(result)
 
 
 @router.post("/phone/send")
 async def send_phone_code(
-    bg_tasks: BackgroundTasks, user=Depends(get_current_user), db: get_db = Depends()
+    bg_tasks: BackgroundTasks,
+    user=Depends(get_current_user),
+    db: get_session = Depends(),
 ):
     result = await ClientService(db).send_phone_code(user, bg_tasks)
     return handle_result(result)
@@ -67,22 +76,22 @@ async def send_phone_code(
 
 @router.post("/phone/verify/{code}")
 async def verify_phone(
-    code: str, user=Depends(get_current_user), db: get_db = Depends()
+    code: str, user=Depends(get_current_user), db: get_session = Depends()
 ):
-    result = ClientService(db).verify_phone(user, code)
+    result = await run_service(ClientService(db).verify_phone, user, code)
     return handle_result(result)
 
 
 @router.post("/login/")
 async def auth_user(
-    user: OAuth2PasswordRequestForm = Depends(), db: get_db = Depends()
+    user: OAuth2PasswordRequestForm = Depends(), db: get_session = Depends()
 ):
-    result = UserService(db).auth_user(user)
+    result = await UserService(db).auth_user(user)
     return handle_result(result)
 
 
 @router.post("/refresh")
-async def refresh_token(access_token: RefreshToken, db: get_db = Depends()):
+async def refresh_token(access_token: RefreshToken, db: get_session = Depends()):
     result = UserService(db).refresh(access_token)
     return handle_result(result)
 
@@ -90,34 +99,46 @@ async def refresh_token(access_token: RefreshToken, db: get_db = Depends()):
 @router.get(
     "/me", summary="Get details of currently logged in user", response_model=Client
 )
-async def get_me(user=Depends(get_current_user)):
+async def get_me(user=Depends(get_current_user), db: get_session = Depends()):
     print(user)
-    return user
+    return await run_in_session(
+        db, lambda session: Client.model_validate(user, from_attributes=True)
+    )
 
 
 @router.post("/register/master")
-async def create_master(master: MasterRegister, db: get_db = Depends()):
-    result = await MasterService(db).create_master(None, master)
+async def create_master(master: MasterRegister, db: get_session = Depends()):
+    result = await MasterService(db).register_master(master)
     return handle_result(result)
 
 
 @router.post("/add/master")
 async def add_master(
-    master: MasterIn, db: get_db = Depends(), user=Depends(get_current_user)
+    master: MasterIn,
+    db: get_session = Depends(),
+    principal: Principal = Depends(get_principal),
 ):
-    result = await MasterService(db).create_master(user.id, master)
+    result = await run_service(
+        MasterService(db).create_master, principal.client_id, master
+    )
     return handle_result(result)
 
 
 @router.get("/clients", response_model=List[Client])
-async def get_clients(user=Depends(get_current_user), db: get_db = Depends()):
-    result = ClientService(db).get_all_clients()
+async def get_clients(
+    principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        ClientService(db).get_all_clients, response_model=List[Client]
+    )
     return handle_result(result)
 
 
 @router.get("/client/{id}", response_model=Client)
-async def get_client(id: int, user=Depends(get_current_user), db: get_db = Depends()):
-    result = ClientService(db).get_client(id)
+async def get_client(
+    id: int, principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(ClientService(db).get_client, id, response_model=Client)
     return handle_result(result)
 
 
@@ -125,30 +146,48 @@ async def get_client(id: int, user=Depends(get_current_user), db: get_db = Depen
 async def patch_client(
     data: ClientEdit = Depends(client_checker),
     file: UploadFile = None,
-    user=Depends(get_current_user),
-    db: get_db = Depends(),
+    principal: Principal = Depends(get_principal),
+    db: get_session = Depends(),
 ):
-    result = ClientService(db).patch_client(
-        user.id, data.model_dump(exclude_unset=True, exclude_defaults=True), file
-    )
+    service = ClientService(db)
+    data = data.model_dump(exclude_unset=True, exclude_defaults=True)
+    result = await service.check_password_change(principal.client_id, data)
+    if result.success:
+        result = await run_service(
+            service.patch_client,
+            principal.client_id,
+            data,
+            file,
+            response_model=Client,
+        )
     return handle_result(result)
 
 
 @router.get("/masters", response_model=List[Master])
-async def get_masters(user=Depends(get_current_user), db: get_db = Depends()):
-    result = MasterService(db).get_all_masters()
+async def get_masters(
+    principal: Principal = Depends(get_principal), db: get_session = Depends()
+):
+    result = await run_service(
+        MasterService(db).get_all_masters, response_model=List[Master]
+    )
     return handle_result(result)
 
 
 @router.get("/master", response_model=Master)
-async def get_master(user=Depends(get_current_user), db: get_db = Depends()):
-    result = MasterService(db).get_master(user)
+async def get_master(user=Depends(get_current_user), db: get_session = Depends()):
+    result = await run_service(
+        MasterService(db).get_master, user, response_model=Master
+    )
     return handle_result(result)
 
 
 @router.get("/master/{username}", response_model=MasterWithName)
-async def get_master_by_username(username: str, db: get_db = Depends()):
-    result = MasterService(db).get_master_by_username(username)
+async def get_master_by_username(username: str, db: get_session = Depends()):
+    result = await run_service(
+        MasterService(db).get_master_by_username,
+        username,
+        response_model=MasterWithName,
+    )
     return handle_result(result)
 
 
@@ -157,10 +196,14 @@ async def patch_master(
     username: str,
     data: MasterEdit,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = MasterService(db).patch_master(
-        username, data.model_dump(exclude_unset=True), user
+    result = await run_service(
+        MasterService(db).patch_master,
+        username,
+        data.model_dump(exclude_unset=True),
+        user,
+        response_model=Master,
     )
     return handle_result(result)
 
@@ -172,15 +215,22 @@ async def patch_user(
     file: UploadFile = None,
     pictures: List[Union[UploadFile, str]] = None,
     user=Depends(get_current_user),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = UserService(db).patch_user(
-        id,
-        data.model_dump(exclude_unset=True, exclude_defaults=True),
-        file,
-        pictures,
-        user,
-    )
+    service = UserService(db)
+    data = data.model_dump(exclude_unset=True, exclude_defaults=True)
+    # The caller's own password is checked; patch_user refuses other ids.
+    result = await service.check_password_change(user.id, data)
+    if result.success:
+        result = await run_service(
+            service.patch_user,
+            id,
+            data,
+            file,
+            pictures,
+            user,
+            response_model=Union[Master, Client],
+        )
     return handle_result(result)
 
 
@@ -192,49 +242,75 @@ async def update_balance(
     amount: float,
     user=Depends(get_current_user),
     is_active=Depends(is_user_active),
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
-    result = UserService(db).update_balance(user, amount)
+    result = await run_service(UserService(db).update_balance, user, amount)
     return handle_result(result)
 
 
 @router.get("/balance/confirm/{payment_id}")
-async def confirm_payment(payment_id: uuid.UUID, db: get_db = Depends()):
-    result = UserService(db).confirm_payment(payment_id)
+async def confirm_payment(payment_id: uuid.UUID, db: get_session = Depends()):
+    result = await run_service(UserService(db).confirm_payment, payment_id)
+    return handle_result(result)
+
+
+def is_trusted_notifier(request: Request) -> bool:
+    try:
+        return SecurityHelper().is_ip_trusted(request.client.host)
+    except (AttributeError, AddrFormatError):
+        return False
+
+
+@router.post("/balance/webhook")
+async def payment_webhook(request: Request, db: get_session = Depends()):
+    if YOOKASSA_WEBHOOK_CHECK_IP and not is_trusted_notifier(request):
+        raise AppException.ForbiddenException("Недоверенный источник уведомления!")
+    body = await request.json()
+    result = await run_service(UserService(db).handle_payment_notification, body)
     return handle_result(result)
 
 
 @router.get("/unread-messages", response_model=List[UnreadMessageOut])
-async def get_unread_messages(user=Depends(get_current_user), db: get_db = Depends()):
-    result = UserService(db).get_unread_messages(user)
+async def get_unread_messages(
+    user=Depends(get_current_user), db: get_session = Depends()
+):
+    result = await run_service(
+        UserService(db).get_unread_messages, user, response_model=List[UnreadMessageOut]
+    )
     return handle_result(result)
 
 
 @router.get("/balance/history", response_model=List[PaymentOut])
-async def get_deposit_history(user=Depends(get_current_user), db: get_db = Depends()):
-    result = UserService(db).get_deposit_history(user)
+async def get_deposit_history(
+    user=Depends(get_current_user), db: get_session = Depends()
+):
+    result = await run_service(
+        UserService(db).get_deposit_history, user, response_model=List[PaymentOut]
+    )
     return handle_result(result)
 
 
 @router.post("/password/recover")
-async def recover_password(data: RecoverPasswordIn, db: get_db = Depends()):
+async def recover_password(data: RecoverPasswordIn, db: get_session = Depends()):
     result = await UserService(db).recover_password(data)
     return handle_result(result)
 
 
 @router.post("/password/verify/{code}")
-async def verify_password_recovery(code: str, user_id: int, db: get_db = Depends()):
-    result = UserService(db).verify_password_recovery(code, user_id)
+async def verify_password_recovery(
+    code: str, user_id: int, db: get_session = Depends()
+):
+    result = await run_service(UserService(db).verify_password_recovery, code, user_id)
     return handle_result(result)
 
 
 @router.post("/password/change")
-async def change_password(data: ChangePasswordIn, db: get_db = Depends()):
-    result = UserService(db).change_password(data)
+async def change_password(data: ChangePasswordIn, db: get_session = Depends()):
+    result = await UserService(db).change_password(data)
     return handle_result(result)
 
 
 @router.delete("/delete")
-async def delete_account(user=Depends(get_current_user), db: get_db = Depends()):
-    result = UserService(db).delete_account(user)
+async def delete_account(user=Depends(get_current_user), db: get_session = Depends()):
+    result = await run_service(UserService(db).delete_account, user)
     return handle_result(result)
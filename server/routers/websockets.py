@@ -1,12 +1,11 @@
 from fastapi import Depends, HTTPException, APIRouter
 from starlette.websockets import WebSocket, WebSocketState
 
-from config.database import get_db
+from config.database import get_session
 from services.chat import ChatService
 from services.user import UserNotificationService
 from utils.app_exceptions import AppExceptionCase
-from utils.dependencies import get_current_user
-
+from utils.dependencies import get_principal
 
 router = APIRouter(
     prefix="/ws",
@@ -16,10 +15,10 @@ router = APIRouter(
 
 
 @router.websocket("/notifications")
-async def notifications(ws: WebSocket, token: str, db: get_db = Depends()):
+async def notifications(ws: WebSocket, token: str, db: get_session = Depends()):
     try:
-        user = await get_current_user(db, token)
-        await UserNotificationService(db).handle_notifications(ws, user)
+        principal = await get_principal(db, token)
+        await UserNotificationService(db).handle_notifications(ws, principal.client_id)
     except AppExceptionCase as error:
         data = {"error": {"status_code": error.status_code, "detail": error.detail}}
         if ws.application_state == WebSocketState.CONNECTING:
@@ -39,11 +38,13 @@ async def chat(
     dialog_id: int,
     receiver_id: int,
     token: str,
-    db: get_db = Depends(),
+    db: get_session = Depends(),
 ):
     try:
-        user = await get_current_user(db, token)
-        await ChatService(db).handle_chat(websocket, dialog_id, user, receiver_id)
+        principal = await get_principal(db, token)
+        await ChatService(db).handle_chat(
+            websocket, dialog_id, principal.client_id, receiver_id
+        )
     except AppExceptionCase as error:
         data = {"error": {"status_code": error.status_code, "detail": error.detail}}
         if websocket.application_state == WebSocketState.CONNECTING:
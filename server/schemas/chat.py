@@ -23,6 +23,13 @@ class MessageEdit(BaseModel):
     is_modified: Optional[bool] = None
 
 
+class Attachment(BaseModel):
+    id: int
+    name: str
+    file: str
+    created_at: datetime
+
+
 class DialogIn(BaseModel):
     sender1_id: int
     sender2_id: int
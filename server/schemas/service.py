@@ -70,6 +70,24 @@ class MasterRepair(BaseModel):
     is_custom: Optional[bool] = None
 
 
+class NearbyMasterRepair(BaseModel):
+    master_id: str
+    repair_id: int
+    address_latitude: float
+    address_longitude: float
+    price: Optional[float] = None
+    time: Optional[str] = None
+    distance: float
+
+
+class MapCluster(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+    min_price: Optional[float] = None
+    master_id: Optional[str] = None
+
+
 class AllServices(BaseModel):
     categories: Optional[List[Category]] = None
     service_types: List[ServiceType]
@@ -36,7 +36,9 @@ class RequestIn(BaseModel):
     title: str
     description: str
     client_price: float
-    service_type_id: Optional[int]
+    service_type_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 
 class Request(BaseModel):
@@ -48,12 +50,27 @@ class Request(BaseModel):
     pictures: Optional[List[str]] = None
     client_price: float
     service_type_id: Optional[int]
-    service_type: ServiceTypeInfo
+    service_type: Optional[ServiceTypeInfo] = None
     status: StatusEnum
     created_at: datetime
     expires_at: datetime
     number_of_offers: int
     views: int
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+class RequestSearch(BaseModel):
+    text: Optional[str] = None
+    service_type_id: Optional[int] = None
+    status: Optional[StatusEnum] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius: Optional[float] = None
 
 
 class RequestEdit(BaseModel):
@@ -1,9 +1,8 @@
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket, WebSocketDisconnect, UploadFile
 
 from cruds.chat import ChatCRUD
-from models.user import Client
 from schemas.chat import DialogIn, Message
-from services.main import AppService
+from services.main import AppService, run_in_session
 from utils.app_exceptions import AppException
 from utils.service_result import ServiceResult
 from utils.socket_managers import SocketChatManager
@@ -11,69 +10,82 @@ from utils.socket_managers import SocketChatManager
 
 class ChatService(AppService):
     async def handle_chat(
-        self, websocket: WebSocket, dialog_id: int, sender: Client, receiver_id: int
+        self, websocket: WebSocket, dialog_id: int, sender_id: int, receiver_id: int
     ):
-        if not ChatCRUD(self.db).is_user_in_dialog(
-            dialog_id, sender.id
-        ) or not ChatCRUD(self.db).is_user_in_dialog(dialog_id, receiver_id):
+        if not await run_in_session(
+            self.db, lambda db: self.has_access(db, dialog_id, sender_id, receiver_id)
+        ):
             raise AppException.ForbiddenException("Нет доступа!")
         manager = SocketChatManager()
-        await manager.connect(websocket, sender.id, dialog_id)
+        await manager.connect(websocket, sender_id, dialog_id)
         try:
             while True:
                 data = await websocket.receive_json()
-                final_data = dict()
-                match data.get("type"):
-                    case 1:
-                        message = ChatCRUD(self.db).create_message(
-                            data.get("message", ""),
-                            data.get("files", []),
-                            dialog_id,
-                            sender.id,
-                        )
-                        final_data["type"] = 1
-                        final_data["message"] = Message(**message.__dict__).model_dump(
-                            mode="json"
-                        )
-                    case 2:
-                        if data.get("message_id"):
-                            message = ChatCRUD(self.db).get_message(
-                                data["message_id"], sender.id
-                            )
-                            new_data = ChatCRUD(self.db).update_message(
-                                message, data.get("message"), data.get("files", [])
-                            )
-                            final_data["type"] = 2
-                            final_data["message"] = Message(
-                                **new_data.__dict__
-                            ).model_dump(mode="json")
-                    case 3:
-                        if data.get("messages"):
-                            messages = ChatCRUD(self.db).make_read(
-                                data["messages"], sender.id
-                            )
-                            final_data["type"] = 3
-                            final_data["messages"] = list()
-                            for message in messages:
-                                final_data["messages"].append(
-                                    Message(**message.__dict__).model_dump(mode="json")
-                                )
-                    case 4:
-                        final_data["type"] = 4
-                        final_data["user"] = sender.id
-                        final_data["is_typing"] = True
-                    case 5:
-                        final_data["type"] = 5
-                        final_data["user"] = sender.id
-                        final_data["is_typing"] = False
-                    case _:
-                        raise AppException.NotFoundException(
-                            "Некорректный тип запроса!"
-                        )
+                final_data = await run_in_session(
+                    self.db,
+                    lambda db: self.handle_frame(db, data, dialog_id, sender_id),
+                )
                 await websocket.send_json(final_data)
                 await manager.send_direct_message(final_data, receiver_id, dialog_id)
         except WebSocketDisconnect:
-            manager.disconnect(sender.id, dialog_id)
+            pass
+        finally:
+            await manager.disconnect(websocket, sender_id, dialog_id)
+
+    @staticmethod
+    def has_access(db, dialog_id: int, sender_id: int, receiver_id: int) -> bool:
+        return ChatCRUD(db).is_user_in_dialog(dialog_id, sender_id) and ChatCRUD(
+            db
+        ).is_user_in_dialog(dialog_id, receiver_id)
+
+    @staticmethod
+    def handle_frame(db, data: dict, dialog_id: int, sender_id: int) -> dict:
+        final_data = dict()
+        match data.get("type"):
+            case 1:
+                message = ChatCRUD(db).create_message(
+                    data.get("message", ""),
+                    data.get("attachments", []),
+                    dialog_id,
+                    sender_id,
+                )
+                final_data["type"] = 1
+                final_data["message"] = Message(**message.__dict__).model_dump(
+                    mode="json"
+                )
+            case 2:
+                if data.get("message_id"):
+                    message = ChatCRUD(db).get_message(data["message_id"], sender_id)
+                    new_data = ChatCRUD(db).update_message(
+                        message,
+                        data.get("message"),
+                        data.get("files", []),
+                        data.get("attachments", []),
+                    )
+                    final_data["type"] = 2
+                    final_data["message"] = Message(**new_data.__dict__).model_dump(
+                        mode="json"
+                    )
+            case 3:
+                if data.get("messages"):
+                    messages = ChatCRUD(db).make_read(data["messages"], sender_id)
+                    final_data["type"] = 3
+                    final_data["messages"] = list()
+                    for message in messages:
+                        final_data["messages"].append(
+                            Message(**message.__dict__).model_dump(mode="json")
+                        )
+            case 4:
+                final_data["type"] = 4
+                final_data["user"] = sender_id
+                final_data["is_typing"] = True
+            case 5:
+                final_data["type"] = 5
+                final_data["user"] = sender_id
+                final_data["is_typing"] = False
+            case _:
+                raise AppException.NotFoundException("Некорректный тип запроса!")
+        return final_data
 
 
 class DialogService(AppService):
@@ -91,6 +103,10 @@ class DialogService(AppService):
 
 
 class MessageService(AppService):
+    def create_attachment(self, file: UploadFile, user_id: int) -> ServiceResult:
+        attachment = ChatCRUD(self.db).create_attachment(file, user_id)
+        return ServiceResult(attachment)
+
     def get_messages(self, dialog_id: int, user_id: int) -> ServiceResult:
         if not ChatCRUD(self.db).is_user_in_dialog(dialog_id, user_id):
             return ServiceResult(AppException.ForbiddenException("Нет доступа!"))
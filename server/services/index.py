@@ -1,13 +1,17 @@
 import models.user
 from schemas.index import ReviewIn, Counters, ArticleCommentIn
 from cruds.index import IndexCRUD
+from models.index import Article
 from services.main import AppService
 from utils.service_result import ServiceResult
+from utils.views import get_view_counter
 
 
 class ArticleService(AppService):
     def get_article(self, id: int) -> ServiceResult:
         article = IndexCRUD(self.db).get_article_by_id(id)
+        if isinstance(article, Article):
+            get_view_counter().hit(Article.__tablename__, article.id)
         return ServiceResult(article)
 
     def get_articles(self) -> ServiceResult:
@@ -32,14 +36,12 @@ class ArticleService(AppService):
         comments = IndexCRUD(self.db).get_comments_by_article_id(article_id)
         return ServiceResult(comments)
 
-    def like_comment(self, comment_id: int, user: models.user.Client) -> ServiceResult:
-        response = IndexCRUD(self.db).like_comment_by_id(comment_id, user.id)
+    def like_comment(self, comment_id: int, user_id: int) -> ServiceResult:
+        response = IndexCRUD(self.db).like_comment_by_id(comment_id, user_id)
         return ServiceResult(response)
 
-    def dislike_comment(
-        self, comment_id: int, user: models.user.Client
-    ) -> ServiceResult:
-        response = IndexCRUD(self.db).dislike_comment_by_id(comment_id, user.id)
+    def dislike_comment(self, comment_id: int, user_id: int) -> ServiceResult:
+        response = IndexCRUD(self.db).dislike_comment_by_id(comment_id, user_id)
         return ServiceResult(response)
 
 
@@ -1,8 +1,25 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from loguru import logger
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from config.settings import (
+    SERVICE_EXECUTOR,
+    SERVICE_QUEUE_SIZE,
+    SERVICE_THREADPOOL_SIZE,
+)
+from utils.app_exceptions import AppException
+from utils.service_result import ServiceResult
+
+T = TypeVar("T")
+
 
 class DBSessionContext(object):
-    def __init__(self, db: Session):
+    def __init__(self, db: Session | AsyncSession):
         self.db = db
 
 
@@ -12,3 +29,69 @@ class AppService(DBSessionContext):
 
 class AppCRUD(DBSessionContext):
     pass
+
+
+_service_executor: ThreadPoolExecutor | None = None
+_service_pending = 0
+
+
+def get_service_executor() -> ThreadPoolExecutor:
+    # Sized like the connection pool: more threads than connections would only
+    # park them waiting for a connection to be checked in.
+    global _service_executor
+    if _service_executor is None:
+        _service_executor = ThreadPoolExecutor(
+            max_workers=SERVICE_THREADPOOL_SIZE, thread_name_prefix="service"
+        )
+    return _service_executor
+
+
+def service_queue_depth() -> int:
+    """Service calls waiting for a free thread."""
+    return max(_service_pending - SERVICE_THREADPOOL_SIZE, 0)
+
+
+async def run_in_session(db: Session | AsyncSession, fn: Callable[[Session], T]) -> T:
+    global _service_pending
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn)
+    if SERVICE_EXECUTOR == "threadpool":
+        # The executor's own queue is unbounded, so calls past
+        # SERVICE_QUEUE_SIZE waiting ones are turned away here.
+        if _service_pending >= SERVICE_THREADPOOL_SIZE + SERVICE_QUEUE_SIZE:
+            logger.bind(service_queue_depth=service_queue_depth()).warning(
+                "Service queue is full"
+            )
+            raise AppException.ServiceUnavailableException(
+                "Сервер перегружен, попробуйте позже!"
+            )
+        _service_pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_service_executor(), fn, db)
+        finally:
+            _service_pending -= 1
+    return fn(db)
+
+
+async def run_service(
+    method: Callable[..., ServiceResult],
+    *args,
+    response_model: Any = None,
+    **kwargs,
+) -> ServiceResult:
+    # The service is rebuilt around the session handed out by run_in_session,
+    # and the response model is loaded there too, so lazy relationships are
+    # resolved while the (possibly async) connection is still usable.
+    context = method.__self__
+
+    def call(session: Session) -> ServiceResult:
+        service = type(context)(session)
+        result = getattr(service, method.__name__)(*args, **kwargs)
+        if result.success and response_model is not None:
+            result.value = TypeAdapter(response_model).validate_python(
+                result.value, from_attributes=True
+            )
+        return result
+
+    return await run_in_session(context.db, call)
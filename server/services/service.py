@@ -4,31 +4,39 @@ from schemas.service import (
     MasterRepairEdit,
     RepairTypeIn,
     RepairTypeEdit,
-    MasterRepair,
+    AllServices,
+    NearbyMasterRepair,
 )
-from utils.app_exceptions import AppException
-from cruds.service import ServiceCRUD
+from utils.app_exceptions import AppException, AppExceptionCase
+from utils.catalog import get_catalog, invalidate_catalog
+from utils.clusters import MAX_TILES, get_clusters, get_tile_range
+from utils.geo_index import master_geo_index
+from cruds.service import ServiceCRUD, master_services_cache
 from services.main import AppService
-from utils.service_result import ServiceResult, handle_result
+from utils.service_result import ServiceResult
 
 
 class ServiceTypeService(AppService):
     def get_service_type(self, id: int) -> ServiceResult:
-        service_type = ServiceCRUD(self.db).get_service_type(id)
+        service_type = get_catalog(self.db).service_types_by_id.get(id)
+        if service_type is None:
+            return ServiceResult(
+                AppException.NotFoundException(detail="Услуга не найдена!")
+            )
         return ServiceResult(service_type)
 
     def get_service_types(self) -> ServiceResult:
-        types = ServiceCRUD(self.db).get_service_types()
-        return ServiceResult(types)
+        types = get_catalog(self.db).service_types
+        return ServiceResult(list(types))
 
     def get_service_types_by_category(self, category_id: int):
-        types = ServiceCRUD(self.db).get_service_types_by_category(category_id)
-        return ServiceResult(types)
+        types = get_catalog(self.db).service_types_by_category.get(category_id, ())
+        return ServiceResult(list(types))
 
 
 class DeviceService(AppService):
     def get_device(self, id: int) -> ServiceResult:
-        device = ServiceCRUD(self.db).get_device(id)
+        device = get_catalog(self.db).devices_by_id.get(id)
         if not device:
             return ServiceResult(
                 AppException.NotFoundException(detail="Устройство не найдено!")
@@ -36,17 +44,17 @@ class DeviceService(AppService):
         return ServiceResult(device)
 
     def get_devices(self) -> ServiceResult:
-        devices = ServiceCRUD(self.db).get_devices()
-        return ServiceResult(devices)
+        devices = get_catalog(self.db).devices
+        return ServiceResult(list(devices))
 
     def get_devices_by_service_type(self, id: int) -> ServiceResult:
-        devices = ServiceCRUD(self.db).get_devices_by_service_type(id)
-        return ServiceResult(devices)
+        devices = get_catalog(self.db).devices_by_service_type.get(id, ())
+        return ServiceResult(list(devices))
 
 
 class CategoryService(AppService):
     def get_category(self, id: int) -> ServiceResult:
-        category = ServiceCRUD(self.db).get_category(id)
+        category = get_catalog(self.db).categories_by_id.get(id)
         if not category:
             return ServiceResult(
                 AppException.NotFoundException(detail="Категория не найдена!")
@@ -54,8 +62,8 @@ class CategoryService(AppService):
         return ServiceResult(category)
 
     def get_categories(self) -> ServiceResult:
-        categories = ServiceCRUD(self.db).get_categories()
-        return ServiceResult(categories)
+        categories = get_catalog(self.db).categories
+        return ServiceResult(list(categories))
 
 
 class RepairTypeService(AppService):
@@ -64,10 +72,11 @@ class RepairTypeService(AppService):
     ) -> ServiceResult:
         master = UserCRUD(self.db).get_master_by_client(user)
         new_repair_type = ServiceCRUD(self.db).create_repair_type(data, master)
+        invalidate_catalog(self.db)
         return ServiceResult(new_repair_type)
 
     def get_repair_type(self, id: int) -> ServiceResult:
-        repair_type = ServiceCRUD(self.db).get_repair_type(id)
+        repair_type = get_catalog(self.db).repair_types_by_id.get(id)
         if not repair_type:
             return ServiceResult(
                 AppException.NotFoundException(detail="Вид ремонта не найден!")
@@ -75,18 +84,20 @@ class RepairTypeService(AppService):
         return ServiceResult(repair_type)
 
     def get_repair_types(self) -> ServiceResult:
-        repair_types = ServiceCRUD(self.db).get_repair_types()
-        return ServiceResult(repair_types)
+        repair_types = get_catalog(self.db).repair_types
+        return ServiceResult(list(repair_types))
 
     def get_repair_types_by_device(self, id: int) -> ServiceResult:
-        repair_types = ServiceCRUD(self.db).get_repair_types_by_device(id)
-        return ServiceResult(repair_types)
+        repair_types = get_catalog(self.db).repair_types_by_device.get(id, ())
+        return ServiceResult(list(repair_types))
 
     def patch_repair_type(
         self, id: int, data: RepairTypeEdit, user: models.user.Client
     ) -> ServiceResult:
         master = UserCRUD(self.db).get_master_by_client(user)
         new_repair_type = ServiceCRUD(self.db).update_repair_type(id, data, master)
+        if not isinstance(new_repair_type, AppExceptionCase):
+            invalidate_catalog(self.db)
         return ServiceResult(new_repair_type)
 
     def patch_master_repair(
@@ -100,33 +111,54 @@ class RepairTypeService(AppService):
             return ServiceResult(AppException.NotFoundException("Not found!"))
         return ServiceResult(master_repair)
 
-    def get_master_repairs(self, master_username: str):
-        master_repairs = ServiceCRUD(self.db).get_all_master_repairs()
-        new_master_repairs = list()
-        for master_repair in master_repairs:
-            pydantic_model = MasterRepair(**master_repair.__dict__)
-            repair_type = handle_result(self.get_repair_type(master_repair.repair_id))
-            if master_username:
-                if repair_type.is_custom and repair_type.created_by != master_username:
-                    continue
-            if (
-                master_repair.master_id != master_username
-                and master_username is not None
-            ):
-                continue
-            device = handle_result(
-                DeviceService(self.db).get_device(repair_type.device_id)
+    def get_master_repairs(self, master_username: str | None) -> ServiceResult:
+        master_repairs = ServiceCRUD(self.db).get_all_master_repairs(master_username)
+        return ServiceResult(master_repairs)
+
+    def get_nearby_master_repairs(
+        self,
+        repair_id: int,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: int,
+    ) -> ServiceResult:
+        found = master_geo_index.get(self.db).nearby(
+            repair_id, latitude, longitude, radius, limit
+        )
+        return ServiceResult(
+            [
+                NearbyMasterRepair(distance=distance, **entry._asdict())
+                for distance, entry in found
+            ]
+        )
+
+    def get_master_clusters(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        zoom: int,
+        repair_id: int | None,
+    ) -> ServiceResult:
+        tile_xs, tile_ys = get_tile_range(min_lat, min_lon, max_lat, max_lon, zoom)
+        if len(tile_xs) * len(tile_ys) > MAX_TILES:
+            return ServiceResult(
+                AppException.ValidationException("Слишком большая область карты!")
+            )
+        index = master_geo_index.get(self.db)
+        clusters = get_clusters(index, repair_id, zoom, tile_xs, tile_ys)
+        return ServiceResult(clusters)
+
+    def get_master_services(self, username: str) -> ServiceResult:
+        master_services = master_services_cache.get(username)
+        if master_services is None:
+            master_services = AllServices.model_validate(
+                ServiceCRUD(self.db).get_all_master_services(username),
+                from_attributes=True,
             )
-            pydantic_model.device = device.name
-            pydantic_model.device_id = device.id
-            pydantic_model.repair_name = repair_type.name
-            pydantic_model.repair_description = repair_type.description
-            pydantic_model.is_custom = repair_type.is_custom
-            new_master_repairs.append(pydantic_model)
-        return ServiceResult(new_master_repairs)
-
-    def get_master_services(self, username: str):
-        master_services = ServiceCRUD(self.db).get_all_master_services(username)
+            master_services_cache.set(username, master_services)
         return ServiceResult(master_services)
 
     def delete_master_repair(
@@ -139,14 +171,4 @@ class RepairTypeService(AppService):
         return ServiceResult(response)
 
     def get_all_services(self) -> ServiceResult:
-        categories = ServiceCRUD(self.db).get_categories()
-        service_types = ServiceCRUD(self.db).get_service_types()
-        devices = ServiceCRUD(self.db).get_devices()
-        repair_types = ServiceCRUD(self.db).get_repair_types()
-        all_services = {
-            "categories": categories,
-            "service_types": service_types,
-            "devices": devices,
-            "repair_types": repair_types,
-        }
-        return ServiceResult(all_services)
+        return ServiceResult(get_catalog(self.db).all_services)
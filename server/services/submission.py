@@ -1,16 +1,18 @@
 from fastapi import HTTPException, UploadFile, BackgroundTasks
 from typing import List
 
-from models import StatusEnum
+from models import StatusEnum, ServiceRequest
 from utils.app_exceptions import AppException
 from cruds.submission import SubmissionCRUD
 from services.main import AppService
 from utils.service_result import ServiceResult
+from utils.views import get_view_counter
 from schemas.submission import (
     OrderIn,
     OrderEdit,
     RequestIn,
     RequestEdit,
+    RequestSearch,
     OfferIn,
     OfferEdit,
     FeedbackIn,
@@ -22,12 +24,14 @@ from cruds.user import UserCRUD
 
 
 class OrderService(AppService):
-    async def create_order(
+    def create_order(
         self, data: OrderIn, user: models.user.Client, bg_tasks: BackgroundTasks
-    ):
-        order = await SubmissionCRUD(self.db).create_order(data, user, bg_tasks)
+    ) -> ServiceResult:
+        order = SubmissionCRUD(self.db).create_order(data, user, bg_tasks)
         if not order:
-            return AppException.CreationException(detail="Не удалось создать заказ!")
+            return ServiceResult(
+                AppException.CreationException(detail="Не удалось создать заказ!")
+            )
         return ServiceResult(order)
 
     def get_order(self, id: int) -> ServiceResult:
@@ -38,8 +42,12 @@ class OrderService(AppService):
             )
         return ServiceResult(order)
 
-    def get_orders_by_client(self, client_id: int) -> ServiceResult:
-        orders = SubmissionCRUD(self.db).get_orders_by_client_id(client_id)
+    def get_orders_by_client(
+        self, client_id: int, cursor: str | None, limit: int
+    ) -> ServiceResult:
+        orders = SubmissionCRUD(self.db).get_orders_by_client_id(
+            client_id, cursor, limit
+        )
         return ServiceResult(orders)
 
     def get_orders_by_master(self, user: models.user.Client) -> ServiceResult:
@@ -70,16 +78,14 @@ class OrderService(AppService):
 
 
 class RequestService(AppService):
-    async def create_request(
+    def create_request(
         self,
         data: RequestIn,
         user: models.user.Client,
         bg_tasks: BackgroundTasks,
         files: List[UploadFile],
     ) -> ServiceResult:
-        request = await SubmissionCRUD(self.db).create_request(
-            data, user, bg_tasks, files
-        )
+        request = SubmissionCRUD(self.db).create_request(data, user, bg_tasks, files)
         if not request:
             return ServiceResult(AppException.NotFoundException("Not found!"))
         return ServiceResult(request)
@@ -88,10 +94,13 @@ class RequestService(AppService):
         request = SubmissionCRUD(self.db).get_request_by_id(id)
         if not request:
             return ServiceResult(AppException.NotFoundException("Заявка не найдена!"))
+        get_view_counter().hit(ServiceRequest.__tablename__, request.id)
         return ServiceResult(request)
 
-    def get_requests(self, user_id: int) -> ServiceResult:
-        requests = SubmissionCRUD(self.db).get_requests(user_id)
+    def get_requests(
+        self, user_id: int, cursor: str | None, limit: int
+    ) -> ServiceResult:
+        requests = SubmissionCRUD(self.db).get_requests(user_id, cursor, limit)
         return ServiceResult(requests)
 
     def get_requests_by_master(self, user: models.user.Client) -> ServiceResult:
@@ -99,8 +108,20 @@ class RequestService(AppService):
         requests = SubmissionCRUD(self.db).get_requests_by_master_username(master)
         return ServiceResult(requests)
 
-    def get_requests_by_client_id(self, client_id: int) -> ServiceResult:
-        requests = SubmissionCRUD(self.db).get_requests_by_client_id(client_id)
+    def search_requests(
+        self, user_id: int, search: RequestSearch, cursor: str | None, limit: int
+    ) -> ServiceResult:
+        requests = SubmissionCRUD(self.db).search_requests(
+            user_id, search, cursor, limit
+        )
+        return ServiceResult(requests)
+
+    def get_requests_by_client_id(
+        self, client_id: int, cursor: str | None, limit: int
+    ) -> ServiceResult:
+        requests = SubmissionCRUD(self.db).get_requests_by_client_id(
+            client_id, cursor, limit
+        )
         return ServiceResult(requests)
 
     def patch_request(self, id: int, data: RequestEdit, user_id: int) -> ServiceResult:
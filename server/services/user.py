@@ -12,9 +12,13 @@ from schemas.user import (
 )
 from utils.app_exceptions import AppException
 import models
-from services.main import AppService
-from utils.auth import refresh_token
+from services.main import AppService, run_in_session, run_service
+from utils.auth import get_hashed_password, refresh_token, verify_password
+from utils.email import Email
+from utils.phone import SMSTransport
+from config.settings import SMS_API_ID
 from utils.service_result import ServiceResult
+from utils.validators import password_validator
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import (
     UploadFile,
@@ -24,19 +28,52 @@ from fastapi import (
     HTTPException,
 )
 
-from utils.socket_managers import SocketManager
+from utils.socket_managers import SocketManager, SocketChatManager
 
 reuseable_oauth = OAuth2PasswordBearer(tokenUrl="/user/login", scheme_name="JWT")
 
 
 class UserService(AppService):
-    def auth_user(self, user: OAuth2PasswordRequestForm) -> ServiceResult:
-        tokens = UserCRUD(self.db).get_jwt_tokens(user)
-        if not tokens:
+    def get_password_by_phone(self, phone: str) -> ServiceResult:
+        user = UserCRUD(self.db).get_password_by_phone(phone)
+        return ServiceResult(user)
+
+    def get_password(self, id: int) -> ServiceResult:
+        password = UserCRUD(self.db).get_password_by_id(id)
+        return ServiceResult(password)
+
+    def get_jwt_tokens(self, user_id: int) -> ServiceResult:
+        tokens = UserCRUD(self.db).get_jwt_tokens(user_id)
+        return ServiceResult(tokens)
+
+    async def auth_user(self, user: OAuth2PasswordRequestForm) -> ServiceResult:
+        # The password is checked between the two service calls, so bcrypt is
+        # awaited instead of holding a service thread.
+        result = await run_service(self.get_password_by_phone, user.username)
+        if not result.success:
+            return result
+        user_id, hashed_password = result.value
+        if not await verify_password(user.password, hashed_password):
             return ServiceResult(
-                AppException.NotFoundException(detail="Пользователь не был найден!")
+                AppException.ValidationException(detail="Неправильный пароль!")
             )
-        return ServiceResult(tokens)
+        return await run_service(self.get_jwt_tokens, user_id)
+
+    async def check_password_change(self, id: int, data: dict) -> ServiceResult:
+        if "new_password1" not in data:
+            return ServiceResult(None)
+        result = await run_service(self.get_password, id)
+        if not result.success:
+            return result
+        if not await verify_password(data.get("old_password", ""), result.value):
+            return ServiceResult(
+                AppException.ValidationException(detail="Неправильный пароль!")
+            )
+        if not password_validator(data["new_password1"], data.get("new_password2")):
+            return ServiceResult(
+                AppException.ValidationException(detail="Некорректный пароль!")
+            )
+        return ServiceResult(None)
 
     @classmethod
     def refresh(cls, token: RefreshToken) -> ServiceResult:
@@ -53,13 +90,6 @@ class UserService(AppService):
     ) -> ServiceResult:
         if id != user.id:
             return ServiceResult(AppException.ForbiddenException(detail="Нет доступа!"))
-        if file:
-            if file.size > 10 * 1024 * 1024:
-                return ServiceResult(
-                    AppException.TooLargeException(
-                        "Изображение превышает размер в 10МБ"
-                    )
-                )
         try:
             master = UserCRUD(self.db).get_master_by_client(user)
         except HTTPException:
@@ -78,6 +108,10 @@ class UserService(AppService):
         response = UserCRUD(self.db).confirm_payment(payment_id)
         return ServiceResult(response)
 
+    def handle_payment_notification(self, body: dict) -> ServiceResult:
+        response = UserCRUD(self.db).handle_payment_notification(body)
+        return ServiceResult(response)
+
     def get_unread_messages(self, user: models.user.Client) -> ServiceResult:
         unread_messages = UserCRUD(self.db).get_unread_messages(user.id)
         return ServiceResult(unread_messages)
@@ -87,49 +121,103 @@ class UserService(AppService):
         history = UserCRUD(self.db).get_deposit_history_by_master(master)
         return ServiceResult(history)
 
+    def set_password_recovery_code(self, data: RecoverPasswordIn) -> ServiceResult:
+        user = UserCRUD(self.db).set_password_recovery_code(data)
+        return ServiceResult(user)
+
     async def recover_password(self, data: RecoverPasswordIn) -> ServiceResult:
-        response = await UserCRUD(self.db).recover_password(data)
-        return ServiceResult(response)
+        result = await run_service(self.set_password_recovery_code, data)
+        if not result.success:
+            return result
+        user = result.value
+        await Email(
+            user, [user.email], user.password_recovery_code
+        ).send_password_recovery_code("Восстановление пароля TsarBirzzha")
+        return ServiceResult({"result": "Success!", "user_id": user.id})
 
     def verify_password_recovery(self, code: str, user_id: int) -> ServiceResult:
         response = UserCRUD(self.db).verify_password_recovery(code, user_id)
         return ServiceResult(response)
 
-    def change_password(self, data: ChangePasswordIn) -> ServiceResult:
-        response = UserCRUD(self.db).change_password(data)
+    def set_password(
+        self, data: ChangePasswordIn, hashed_password: str
+    ) -> ServiceResult:
+        response = UserCRUD(self.db).change_password(data, hashed_password)
         return ServiceResult(response)
 
+    async def change_password(self, data: ChangePasswordIn) -> ServiceResult:
+        # The code is checked first, so the hash pool only works for callers
+        # holding a recovery code.
+        result = await run_service(
+            self.verify_password_recovery, data.code, data.user_id
+        )
+        if not result.success:
+            return result
+        if not password_validator(data.password):
+            return ServiceResult(
+                AppException.ValidationException("Пароль не удовлетворяет требованиям!")
+            )
+        hashed_password = await get_hashed_password(data.password)
+        return await run_service(self.set_password, data, hashed_password)
+
     def delete_account(self, user: models.user.Client) -> ServiceResult:
         response = UserCRUD(self.db).delete_account(user)
         return ServiceResult(response)
 
 
 class ClientService(UserService):
-    async def create_client(self, client: ClientRegister) -> ServiceResult:
-        dbclient = await UserCRUD(self.db).create_client(client)
+    def create_client(
+        self, client: ClientRegister, hashed_password: str
+    ) -> ServiceResult:
+        dbclient = UserCRUD(self.db).create_client(client, hashed_password)
         if not dbclient:
             return ServiceResult(
                 AppException.RegistrationException(detail="Ошибка регистрации!")
             )
         return ServiceResult(dbclient)
 
-    async def send_email_code(self, user: models.user.Client) -> ServiceResult:
-        response = await UserCRUD(self.db).send_email_verification_code(user)
-        if not response:
+    async def register_client(self, client: ClientRegister) -> ServiceResult:
+        if not password_validator(client.password1, client.password2):
+            return ServiceResult(
+                AppException.ValidationException(detail="Некорректный пароль!")
+            )
+        hashed_password = await get_hashed_password(client.password1)
+        return await run_service(self.create_client, client, hashed_password)
+
+    def set_email_code(self, user: models.user.Client) -> ServiceResult:
+        code = UserCRUD(self.db).set_email_verification_code(user)
+        if not code:
             return ServiceResult(
                 AppException.NotFoundException("Ошибка подтверждения почты!")
             )
-        return ServiceResult(response)
+        return ServiceResult(code)
+
+    async def send_email_code(self, user: models.user.Client) -> ServiceResult:
+        result = await run_service(self.set_email_code, user)
+        if not result.success:
+            return result
+        await Email(
+            user, code=result.value, email=[user.email]
+        ).send_verification_code()
+        return ServiceResult({"result": "Success!"})
 
     def verify_email(self, user: models.user.Client, code: str) -> ServiceResult:
         response = UserCRUD(self.db).verify_email(user, code)
         return ServiceResult(response)
 
+    def set_phone_code(self, user: models.user.Client) -> ServiceResult:
+        code = UserCRUD(self.db).set_phone_verification_code(user)
+        return ServiceResult(code)
+
     async def send_phone_code(
         self, user: models.user.Client, bg_tasks: BackgroundTasks
     ) -> ServiceResult:
-        response = await UserCRUD(self.db).send_phone_verification_code(user, bg_tasks)
-        return ServiceResult(response)
+        result = await run_service(self.set_phone_code, user)
+        if not result.success:
+            return result
+        sms = SMSTransport(api_id=SMS_API_ID)
+        await sms.send(user.phone[1:], f"Ваш код подтверждения: {result.value}")
+        return ServiceResult({"result": "Success!"})
 
     def verify_phone(self, user: models.user.Client, code: str) -> ServiceResult:
         response = UserCRUD(self.db).verify_phone(user, code)
@@ -159,16 +247,27 @@ class ClientService(UserService):
 
 
 class MasterService(UserService):
-    async def create_master(
-        self, id: int | None, master: MasterIn | MasterRegister
+    def create_master(
+        self,
+        id: int | None,
+        master: MasterIn | MasterRegister,
+        hashed_password: str | None = None,
     ) -> ServiceResult:
-        dbmaster = await UserCRUD(self.db).create_master(id, master)
+        dbmaster = UserCRUD(self.db).create_master(id, master, hashed_password)
         if not dbmaster:
             return ServiceResult(
                 AppException.RegistrationException(detail="Ошибка регистрации!")
             )
         return ServiceResult(dbmaster)
 
+    async def register_master(self, master: MasterRegister) -> ServiceResult:
+        if not password_validator(master.password1, master.password2):
+            return ServiceResult(
+                AppException.ValidationException(detail="Некорректный пароль!")
+            )
+        hashed_password = await get_hashed_password(master.password1)
+        return await run_service(self.create_master, None, master, hashed_password)
+
     def get_all_masters(self) -> ServiceResult:
         masters = UserCRUD(self.db).get_all_masters()
         if not masters:
@@ -203,15 +302,32 @@ class MasterService(UserService):
 
 
 class UserNotificationService(AppService):
-    async def handle_notifications(self, ws: WebSocket, user: models.user.Client):
+    async def handle_notifications(self, ws: WebSocket, user_id: int):
         manager = SocketManager()
-        await manager.connect(ws, user.id)
+        chat_manager = SocketChatManager()
+        await manager.connect(ws, user_id)
         try:
             while True:
                 data = await ws.receive_json()
-                new_data, receiver = UserCRUD(self.db).notification_handler(data, user)
+                online_users = None
+                receiver_in_chat = False
+                match data.get("type"):
+                    case 1:
+                        online_users = await manager.get_online_users()
+                    case 2:
+                        receiver_in_chat = await chat_manager.is_connected(
+                            data.get("receiver_id"), data.get("dialog_id")
+                        )
+                new_data, receiver = await run_in_session(
+                    self.db,
+                    lambda db: UserCRUD(db).notification_handler(
+                        data, user_id, online_users, receiver_in_chat
+                    ),
+                )
                 if new_data and receiver:
-                    if receiver in manager.active_connections:
-                        await manager.send_direct_message(new_data, receiver)
+                    await manager.send_direct_message(new_data, receiver)
         except WebSocketDisconnect:
-            manager.disconnect(user.id)
+            pass
+        finally:
+            # Also on errors, so a dead socket does not keep the user online.
+            await manager.disconnect(ws, user_id)
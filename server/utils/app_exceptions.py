@@ -86,6 +86,12 @@ class AppException(object):
             self.detail = detail
             self.status_code = 413
 
+    class ServiceUnavailableException(AppExceptionCase):
+        def __init__(self, detail: str = None):
+            self.exception_case = "Service unavailable"
+            self.detail = detail
+            self.status_code = 503
+
 
 async def internal_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
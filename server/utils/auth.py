@@ -1,3 +1,9 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt
@@ -10,20 +16,83 @@ from config.settings import (
     ALGORITHM,
     JWT_SECRET_KEY,
     JWT_REFRESH_SECRET_KEY,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_SIZE,
 )
 from schemas.user import TokenPayload
+from utils.app_exceptions import AppException
 
 password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt holds the GIL for the whole hash, so it runs in worker processes and
+# is awaited on the event loop, before the service call is dispatched. At most
+# PASSWORD_HASH_QUEUE_SIZE hashes wait for a free worker; the rest are turned
+# away instead of piling up behind a login burst.
+_hash_executor: ProcessPoolExecutor | None = None
+_hash_executor_lock = threading.Lock()
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE)
+_hash_pending = 0
+
 
-def get_hashed_password(password: str) -> str:
+def _hash(password: str) -> str:
     return password_context.hash(password)
 
 
-def verify_password(password: str, hashed_password: str) -> bool:
+def _verify(password: str, hashed_password: str) -> bool:
     return password_context.verify(password, hashed_password)
 
 
+def get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            # Forking a process that runs threads can copy held locks into
+            # the children, so the workers are spawned.
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _hash_executor
+
+
+def shutdown_hash_executor() -> None:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(cancel_futures=True)
+            _hash_executor = None
+
+
+def hash_queue_depth() -> int:
+    """Password hashes waiting for a free worker process."""
+    return max(_hash_pending - PASSWORD_HASH_WORKERS, 0)
+
+
+async def _run_hash(fn, *args):
+    global _hash_pending
+    if _hash_slots.locked():
+        logger.bind(hash_queue_depth=hash_queue_depth()).warning(
+            "Password hash queue is full"
+        )
+        raise AppException.ServiceUnavailableException(
+            "Сервер перегружен, попробуйте позже!"
+        )
+    async with _hash_slots:
+        _hash_pending += 1
+        try:
+            return await asyncio.wrap_future(get_hash_executor().submit(fn, *args))
+        finally:
+            _hash_pending -= 1
+
+
+async def get_hashed_password(password: str) -> str:
+    return await _run_hash(_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run_hash(_verify, password, hashed_password)
+
+
 def create_access_token(subject: Union[str, any], expires_delta: int = None) -> str:
     if expires_delta is not None:
         expires_delta = datetime.utcnow() + timedelta(seconds=expires_delta)
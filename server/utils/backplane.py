@@ -0,0 +1,213 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from config.settings import SOCKET_BACKPLANE, SOCKET_BACKPLANE_URL, SOCKET_PRESENCE_TTL
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane(object):
+    """Pub/sub channel shared by every web worker.
+
+    Socket managers publish outgoing frames to a channel and subscribe to
+    the channels of the sockets connected to the current process, so a frame
+    reaches its receiver whichever worker holds the connection.
+    """
+
+    async def publish(self, channel: str, data: dict) -> None:
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str) -> None:
+        raise NotImplementedError
+
+    async def add_presence(self, namespace: str, member: str) -> None:
+        raise NotImplementedError
+
+    async def remove_presence(self, namespace: str, member: str) -> None:
+        raise NotImplementedError
+
+    async def get_presence(self, namespace: str) -> set[str]:
+        raise NotImplementedError
+
+    async def has_presence(self, namespace: str, member: str) -> bool:
+        raise NotImplementedError
+
+
+class InMemoryBackplane(Backplane):
+    """Single-process stand-in, used by default and in tests."""
+
+    def __init__(self):
+        self._handlers: dict[str, Handler] = dict()
+        self._presence: dict[str, Counter] = dict()
+
+    async def publish(self, channel: str, data: dict) -> None:
+        handler = self._handlers.get(channel)
+        if handler:
+            await handler(json.loads(json.dumps(data)))
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel] = handler
+
+    async def unsubscribe(self, channel: str) -> None:
+        self._handlers.pop(channel, None)
+
+    async def add_presence(self, namespace: str, member: str) -> None:
+        self._presence.setdefault(namespace, Counter())[member] += 1
+
+    async def remove_presence(self, namespace: str, member: str) -> None:
+        members = self._presence.get(namespace, Counter())
+        members[member] -= 1
+        if members[member] <= 0:
+            del members[member]
+
+    async def get_presence(self, namespace: str) -> set[str]:
+        return set(self._presence.get(namespace, Counter()))
+
+    async def has_presence(self, namespace: str, member: str) -> bool:
+        return member in self._presence.get(namespace, Counter())
+
+
+# Drops the member once the last of its connections on this worker is gone.
+REMOVE_PRESENCE_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+
+class RedisBackplane(Backplane):
+    """Presence is kept per worker: a hash of member -> connection count under
+    presence:<namespace>:<worker>, and the workers of a namespace in a sorted
+    set scored by their last heartbeat. The hashes expire after
+    SOCKET_PRESENCE_TTL unless refreshed, so the users of a crashed worker
+    drop out instead of staying online forever."""
+
+    def __init__(self, url: str):
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._pubsub = self._redis.pubsub()
+        self._handlers: dict[str, Handler] = dict()
+        self._listener: asyncio.Task | None = None
+        self._worker_id = uuid.uuid4().hex
+        self._namespaces: set[str] = set()
+        self._heartbeat: asyncio.Task | None = None
+        self._remove_presence = self._redis.register_script(REMOVE_PRESENCE_SCRIPT)
+
+    async def publish(self, channel: str, data: dict) -> None:
+        await self._redis.publish(channel, json.dumps(data))
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel] = handler
+        await self._pubsub.subscribe(channel)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def unsubscribe(self, channel: str) -> None:
+        self._handlers.pop(channel, None)
+        await self._pubsub.unsubscribe(channel)
+
+    def _presence_key(self, namespace: str, worker_id: str) -> str:
+        return f"presence:{namespace}:{worker_id}"
+
+    async def _touch_presence(self, namespace: str) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.expire(
+                self._presence_key(namespace, self._worker_id), SOCKET_PRESENCE_TTL
+            )
+            pipe.zadd(f"presence:{namespace}:workers", {self._worker_id: time.time()})
+            await pipe.execute()
+
+    async def _live_presence_keys(self, namespace: str) -> list[str]:
+        workers_key = f"presence:{namespace}:workers"
+        deadline = time.time() - SOCKET_PRESENCE_TTL
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(workers_key, "-inf", deadline)
+            pipe.zrangebyscore(workers_key, deadline, "+inf")
+            _, workers = await pipe.execute()
+        return [self._presence_key(namespace, worker_id) for worker_id in workers]
+
+    async def add_presence(self, namespace: str, member: str) -> None:
+        await self._redis.hincrby(
+            self._presence_key(namespace, self._worker_id), member, 1
+        )
+        await self._touch_presence(namespace)
+        self._namespaces.add(namespace)
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._refresh_presence())
+
+    async def remove_presence(self, namespace: str, member: str) -> None:
+        await self._remove_presence(
+            keys=[self._presence_key(namespace, self._worker_id)], args=[member]
+        )
+
+    async def get_presence(self, namespace: str) -> set[str]:
+        keys = await self._live_presence_keys(namespace)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hkeys(key)
+            results = await pipe.execute()
+        return {member for members in results for member in members}
+
+    async def has_presence(self, namespace: str, member: str) -> bool:
+        keys = await self._live_presence_keys(namespace)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hexists(key, member)
+            return any(await pipe.execute())
+
+    async def _refresh_presence(self) -> None:
+        while True:
+            await asyncio.sleep(SOCKET_PRESENCE_TTL / 3)
+            for namespace in list(self._namespaces):
+                try:
+                    await self._touch_presence(namespace)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Presence heartbeat failed: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Backplane listener failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message:
+                continue
+            handler = self._handlers.get(message["channel"])
+            if handler:
+                try:
+                    await handler(json.loads(message["data"]))
+                except Exception as e:
+                    logger.error(f"Backplane delivery failed: {e}")
+
+
+_backplane: Backplane | None = None
+
+
+def get_backplane() -> Backplane:
+    global _backplane
+    if _backplane is None:
+        if SOCKET_BACKPLANE == "redis":
+            _backplane = RedisBackplane(SOCKET_BACKPLANE_URL)
+        else:
+            _backplane = InMemoryBackplane()
+    return _backplane
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, TypeVar
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config.database import get_db
+from models.index import CacheVersion
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class TTLCache(object):
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Entries live in the memory of one worker process, so writers invalidate
+    their own process explicitly and `ttl` bounds how long any other worker
+    may keep serving a stale value.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def get_cache_version(db: Session, name: str) -> int:
+    version = db.query(CacheVersion.version).filter(CacheVersion.name == name).scalar()
+    return version or 0
+
+
+def bump_cache_version(db: Session, name: str, commit: bool = True) -> None:
+    # Shared version stamp for data cached inside the workers: each worker
+    # compares it with the version of its snapshot and rebuilds on mismatch.
+    updated = (
+        db.query(CacheVersion)
+        .filter(CacheVersion.name == name)
+        .update({CacheVersion.version: CacheVersion.version + 1})
+    )
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(CacheVersion(name=name, version=1))
+        except IntegrityError:
+            return bump_cache_version(db, name, commit)
+    if commit:
+        db.commit()
+
+
+class VersionedSnapshot(Generic[T]):
+    """Immutable value built from the database and shared by a worker's
+    threads.
+
+    The stored version stamp is looked up at most every `check_interval`
+    seconds and the value rebuilt when it moved; `max_age` additionally
+    rebuilds values that include data not covered by the stamp. With `update`,
+    a value that has not expired is brought to the new version from the
+    previous one instead of being rebuilt.
+
+    The lookup and the build run without holding the lock: under
+    DATABASE_ASYNC they run on the event loop thread and yield to other
+    requests while waiting on the database. Concurrent callers may then build
+    the same value twice; the lock only guards swapping the result in, and a
+    build for an older version never replaces a newer one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[Session, int], T],
+        check_interval: float,
+        max_age: float | None = None,
+        update: Callable[[T, Session, int], T] | None = None,
+    ):
+        self.name = name
+        self._build = build
+        self._update = update
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._value: T | None = None
+        self._version: int | None = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+
+    def _is_expired(self, now: float) -> bool:
+        return self.max_age is not None and now - self._built_at >= self.max_age
+
+    def get(self, db: Session) -> T:
+        now = time.monotonic()
+        value = self._value
+        if (
+            value is not None
+            and now - self._checked_at < self.check_interval
+            and not self._is_expired(now)
+        ):
+            return value
+        version = get_cache_version(db, self.name)
+        if value is not None and self._version == version and not self._is_expired(now):
+            self._checked_at = now
+            return value
+        if value is not None and self._update and not self._is_expired(now):
+            value = self._update(value, db, version)
+        else:
+            value = self._build(db, version)
+        with self._lock:
+            if self._version is None or version >= self._version:
+                self._value = value
+                self._version = version
+                self._built_at = now
+            self._checked_at = now
+            return self._value
+
+    def invalidate(self, db: Session) -> None:
+        bump_cache_version(db, self.name)
+        self._checked_at = 0.0
+
+    def invalidate_once(self) -> None:
+        db = next(get_db())
+        try:
+            self.invalidate(db)
+        finally:
+            db.close()
@@ -0,0 +1,101 @@
+import hashlib
+from collections import defaultdict
+from types import MappingProxyType
+
+from sqlalchemy.orm import Session, joinedload
+
+from config.settings import CATALOG_CHECK_INTERVAL, CATALOG_MAX_AGE
+from models.service import ServiceCategory, ServiceType, Device, RepairType
+from schemas.service import (
+    AllServices,
+    Category as CategorySchema,
+    ServiceType as ServiceTypeSchema,
+    Device as DeviceSchema,
+    RepairType as RepairTypeSchema,
+)
+from utils.cache import VersionedSnapshot
+
+CATALOG_VERSION = "catalog"
+
+
+def _group_by(items: tuple, attr: str) -> MappingProxyType:
+    groups = defaultdict(list)
+    for item in items:
+        groups[getattr(item, attr)].append(item)
+    return MappingProxyType({key: tuple(value) for key, value in groups.items()})
+
+
+def _index_by_id(items: tuple) -> MappingProxyType:
+    return MappingProxyType({item.id: item for item in items})
+
+
+class Catalog(object):
+    """Immutable snapshot of categories, service types, devices and repair
+    types, validated once and indexed for the catalog endpoints."""
+
+    def __init__(
+        self,
+        version: int,
+        categories: tuple,
+        service_types: tuple,
+        devices: tuple,
+        repair_types: tuple,
+    ):
+        self.version = version
+        self.categories = categories
+        self.service_types = service_types
+        self.devices = devices
+        self.repair_types = repair_types
+        self.categories_by_id = _index_by_id(categories)
+        self.service_types_by_id = _index_by_id(service_types)
+        self.devices_by_id = _index_by_id(devices)
+        self.repair_types_by_id = _index_by_id(repair_types)
+        self.service_types_by_category = _group_by(service_types, "category_id")
+        self.devices_by_service_type = _group_by(devices, "service_id")
+        self.repair_types_by_device = _group_by(repair_types, "device_id")
+        self.all_services = AllServices(
+            categories=list(categories),
+            service_types=list(service_types),
+            devices=list(devices),
+            repair_types=list(repair_types),
+        )
+        # Rebuilds by age can change the embedded master profiles without a
+        # version bump, so the ETag follows the content.
+        digest = hashlib.sha1(self.all_services.model_dump_json().encode()).hexdigest()
+        self.etag = f'"catalog-{version}-{digest[:16]}"'
+
+    @classmethod
+    def load(cls, db: Session, version: int) -> "Catalog":
+        def validate(schema, rows):
+            return tuple(
+                schema.model_validate(row, from_attributes=True) for row in rows
+            )
+
+        return cls(
+            version,
+            validate(CategorySchema, db.query(ServiceCategory).all()),
+            validate(ServiceTypeSchema, db.query(ServiceType).all()),
+            validate(DeviceSchema, db.query(Device).all()),
+            validate(
+                RepairTypeSchema,
+                db.query(RepairType).options(joinedload(RepairType.master)).all(),
+            ),
+        )
+
+
+catalog_snapshot = VersionedSnapshot(
+    CATALOG_VERSION,
+    Catalog.load,
+    check_interval=CATALOG_CHECK_INTERVAL,
+    # The master profiles embedded in custom repair types do not bump the
+    # version, so they are refreshed by age.
+    max_age=CATALOG_MAX_AGE,
+)
+
+
+def get_catalog(db: Session) -> Catalog:
+    return catalog_snapshot.get(db)
+
+
+def invalidate_catalog(db: Session) -> None:
+    catalog_snapshot.invalidate(db)
@@ -0,0 +1,86 @@
+import math
+
+from config.settings import MAP_CLUSTER_TILE_CACHE_SIZE, MAP_CLUSTER_TILE_CACHE_TTL
+from utils.cache import TTLCache
+from utils.geo import from_mercator, to_mercator
+from utils.geo_index import MasterGeoIndex
+
+MAX_ZOOM = 20
+# Every 256px tile is split into 2**CELL_BITS cells per side, so one cluster
+# stands for at most a 32px square on screen.
+CELL_BITS = 3
+MAX_TILES = 64
+
+# Tiles are keyed by the geo index version, so a master address change, which
+# bumps that version, makes the next request recompute them.
+tile_cache = TTLCache(
+    maxsize=MAP_CLUSTER_TILE_CACHE_SIZE, ttl=MAP_CLUSTER_TILE_CACHE_TTL
+)
+
+
+def get_tile_range(
+    min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int
+) -> tuple[range, range]:
+    tiles = 2**zoom
+    min_x, max_y = to_mercator(min_lat, min_lon)
+    max_x, min_y = to_mercator(max_lat, max_lon)
+    return (
+        range(math.floor(min_x * tiles), math.floor(max_x * tiles) + 1),
+        range(math.floor(min_y * tiles), math.floor(max_y * tiles) + 1),
+    )
+
+
+def build_tile(
+    index: MasterGeoIndex, repair_id: int | None, zoom: int, tile_x: int, tile_y: int
+) -> tuple[dict, ...]:
+    tiles = 2**zoom
+    cells = 2 ** (zoom + CELL_BITS)
+    max_lat, min_lon = from_mercator(tile_x / tiles, tile_y / tiles)
+    min_lat, max_lon = from_mercator((tile_x + 1) / tiles, (tile_y + 1) / tiles)
+    clusters = dict()
+    for entry in index.within(repair_id, min_lat, max_lat, min_lon, max_lon):
+        x, y = to_mercator(entry.address_latitude, entry.address_longitude)
+        if math.floor(x * tiles) != tile_x or math.floor(y * tiles) != tile_y:
+            continue
+        cell = (math.floor(x * cells), math.floor(y * cells))
+        cluster = clusters.get(cell)
+        if cluster is None:
+            clusters[cell] = cluster = {
+                "count": 0,
+                "latitude": 0.0,
+                "longitude": 0.0,
+                "min_price": None,
+                "master_id": entry.master_id,
+            }
+        cluster["count"] += 1
+        cluster["latitude"] += entry.address_latitude
+        cluster["longitude"] += entry.address_longitude
+        if entry.price is not None and (
+            cluster["min_price"] is None or entry.price < cluster["min_price"]
+        ):
+            cluster["min_price"] = entry.price
+    for cluster in clusters.values():
+        cluster["latitude"] /= cluster["count"]
+        cluster["longitude"] /= cluster["count"]
+        if cluster["count"] > 1:
+            cluster["master_id"] = None
+    return tuple(clusters.values())
+
+
+def get_clusters(
+    index: MasterGeoIndex,
+    repair_id: int | None,
+    zoom: int,
+    tile_xs: range,
+    tile_ys: range,
+) -> list[dict]:
+    clusters = list()
+    for tile_x in tile_xs:
+        for tile_y in tile_ys:
+            key = (index.version, repair_id, zoom, tile_x, tile_y)
+            tile = tile_cache.get(key)
+            if tile is None:
+                tile = build_tile(index, repair_id, zoom, tile_x, tile_y)
+                tile_cache.set(key, tile)
+            clusters.extend(tile)
+    return clusters
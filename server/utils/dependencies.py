@@ -1,8 +1,17 @@
-from config.database import get_db
+from config.database import get_session
 from fastapi import Depends, HTTPException, status, Form
 
 from config.settings import ALGORITHM, JWT_SECRET_KEY
 from models.user import Client
+from services.main import run_in_session
+from sqlalchemy.orm import joinedload
+from utils.principal import (
+    Principal,
+    principal_cache,
+    load_principal,
+    invalidate_principal,
+    principal_from_client,
+)
 from jose import jwt
 from datetime import datetime
 
@@ -15,10 +24,11 @@ from fastapi.encoders import jsonable_encoder
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/login", scheme_name="JWT")
 
 
-async def get_current_user(db=Depends(get_db), token=Depends(oauth2_scheme)) -> Client:
+def decode_token(token: str) -> int:
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
         token_data = TokenPayload(**payload)
+        client_id = int(token_data.sub)
 
         if datetime.fromtimestamp(token_data.exp) < datetime.now():
             raise HTTPException(
@@ -27,31 +37,67 @@ async def get_current_user(db=Depends(get_db), token=Depends(oauth2_scheme)) ->
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-    except (jwt.JWTError, ValidationError):
+    except (jwt.JWTError, ValidationError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Необходимо авторизоваться",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return client_id
 
-    user: Client = db.query(Client).filter(Client.id == token_data.sub).first()
+
+async def get_principal(
+    db=Depends(get_session), token=Depends(oauth2_scheme)
+) -> Principal:
+    client_id = decode_token(token)
+    principal = principal_cache.get(client_id)
+    if principal is None:
+        principal = await run_in_session(
+            db, lambda session: load_principal(session, client_id)
+        )
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден!",
+        )
+    return principal
+
+
+async def get_current_user(
+    db=Depends(get_session), token=Depends(oauth2_scheme)
+) -> Client:
+    """The ORM row, for handlers that read or change the client; handlers
+    that only need the id or flags depend on get_principal instead. The
+    master comes in the same query, so get_master_by_client does not look it
+    up again, and a principal cache miss is filled from the same row."""
+    client_id = decode_token(token)
+    user: Client = await run_in_session(
+        db,
+        lambda session: session.query(Client)
+        .options(joinedload(Client.master))
+        .filter(Client.id == client_id)
+        .first(),
+    )
 
     if user is None:
+        invalidate_principal(client_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Пользователь не найден!",
         )
+    if principal_cache.get(client_id) is None:
+        principal_cache.set(client_id, principal_from_client(user))
 
     return user
 
 
-async def is_user_active(user: Client = Depends(get_current_user)) -> None:
-    if not user.is_email_verified:
+async def is_user_active(principal: Principal = Depends(get_principal)) -> None:
+    if not principal.is_email_verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Подтвердите почту!",
         )
-    if not user.is_phone_verified:
+    if not principal.is_phone_verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Подтвердите номер телефона!"
         )
@@ -1,9 +1,14 @@
-from typing import List
+import os
+import re
+import uuid
+from typing import List, Iterable
+
+from markupsafe import escape
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from pydantic import EmailStr, BaseModel
 
 import models
-from jinja2 import Environment, select_autoescape, PackageLoader
+from jinja2 import Environment, select_autoescape, FileSystemLoader
 
 from config.settings import (
     EMAIL_HOST,
@@ -20,10 +25,44 @@ class EmailSchema(BaseModel):
 
 
 env = Environment(
-    loader=PackageLoader(package_name="main", package_path="templates/email"),
+    # Loading from the directory rather than the "main" package keeps this
+    # module importable from the worker without importing the whole app.
+    loader=FileSystemLoader(
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "email")
+    ),
     autoescape=select_autoescape(["html", "xml"]),
+    # Templates ship with the code, so they are compiled once below and never
+    # checked for changes again.
+    auto_reload=False,
 )
 
+templates = {
+    name: env.get_template(name)
+    for name in ("mailing.html", "verification.html", "password_recovery.html")
+}
+
+
+class CampaignTemplate:
+    """A template rendered once for everything recipients share; the
+    per-recipient variables are rendered as markers, so rendering for a
+    recipient is only joining the static parts with the escaped values."""
+
+    def __init__(self, name: str, variables: Iterable[str], **context):
+        marker = uuid.uuid4().hex
+        html = templates[name].render(
+            **context, **{variable: f"{marker}:{variable}:" for variable in variables}
+        )
+        pieces = re.split(f"{marker}:(\\w+):", html)
+        self.parts = pieces[0::2]
+        self.variables = pieces[1::2]
+
+    def render(self, **values) -> str:
+        rendered = [self.parts[0]]
+        for variable, part in zip(self.variables, self.parts[1:]):
+            rendered.append(escape(values[variable]))
+            rendered.append(part)
+        return "".join(rendered)
+
 
 class Email:
     conf = ConnectionConfig(
@@ -55,7 +94,7 @@ class Email:
         pass
 
     async def send_mailing(self, subject):
-        template = env.get_template(f"mailing.html")
+        template = templates["mailing.html"]
 
         html = template.render(
             entity_id=self.entity_id,
@@ -72,7 +111,7 @@ class Email:
         await fm.send_message(message)
 
     async def send_mail(self, subject):
-        template = env.get_template(f"verification.html")
+        template = templates["verification.html"]
 
         html = template.render(code=self.code, first_name=self.name, subject=subject)
 
@@ -86,7 +125,7 @@ class Email:
         await fm.send_message(message)
 
     async def send_password_recovery_code(self, subject: str) -> None:
-        template = env.get_template(f"password_recovery.html")
+        template = templates["password_recovery.html"]
 
         html = template.render(code=self.code, first_name=self.name, subject=subject)
 
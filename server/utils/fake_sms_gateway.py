@@ -0,0 +1,37 @@
+"""Offline stand-in for the sms.ru send endpoint, for load tests:
+
+    uvicorn utils.fake_sms_gateway:app --port 8025
+
+with SMS_URL=http://127.0.0.1:8025/sms/send. FAKE_SMS_LATENCY adds a delay
+in seconds to every answer and FAKE_SMS_FAILURE_RATE is the share of
+requests answered with a 503."""
+
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, Response
+
+FAKE_SMS_LATENCY: float = float(os.environ.get("FAKE_SMS_LATENCY", 0))
+FAKE_SMS_FAILURE_RATE: float = float(os.environ.get("FAKE_SMS_FAILURE_RATE", 0))
+
+app = FastAPI()
+app.state.sent = list()
+
+
+@app.get("/sms/send")
+async def send(to: str, msg: str, response: Response):
+    if FAKE_SMS_LATENCY:
+        await asyncio.sleep(FAKE_SMS_LATENCY)
+    if random.random() < FAKE_SMS_FAILURE_RATE:
+        response.status_code = 503
+        return {"status": "ERROR", "status_code": 503}
+    app.state.sent.append((to, msg))
+    return {
+        "status": "OK",
+        "status_code": 100,
+        "sms": {
+            to: {"status": "OK", "status_code": 100, "sms_id": str(len(app.state.sent))}
+        },
+        "balance": 100.0,
+    }
@@ -0,0 +1,49 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def bounding_box(
+    latitude: float, longitude: float, radius_km: float
+) -> tuple[float, float, float, float]:
+    # Coarse (min_lat, max_lat, min_lon, max_lon) box around a circle, cheap to
+    # check against an index before the exact great-circle distance.
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6:
+        delta_lon = 180.0
+    else:
+        delta_lon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (
+        latitude - delta_lat,
+        latitude + delta_lat,
+        longitude - delta_lon,
+        longitude + delta_lon,
+    )
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def to_mercator(latitude: float, longitude: float) -> tuple[float, float]:
+    # Web Mercator position normalized to [0, 1) on both axes, y growing south.
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    x = (longitude + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def from_mercator(x: float, y: float) -> tuple[float, float]:
+    longitude = x * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return latitude, longitude
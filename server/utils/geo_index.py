@@ -0,0 +1,220 @@
+import datetime
+import heapq
+import math
+from collections import defaultdict
+from types import MappingProxyType
+from typing import Iterator, NamedTuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config.settings import (
+    GEO_INDEX_CELL_SIZE,
+    GEO_INDEX_CHECK_INTERVAL,
+    GEO_INDEX_CHANGE_SLACK,
+    GEO_INDEX_CHANGE_RETENTION,
+)
+from models.index import GeoIndexChange
+from models.relationship import MasterRepair
+from models.user import Master
+from utils.cache import VersionedSnapshot, bump_cache_version
+from utils.geo import bounding_box, haversine
+
+MASTER_GEO_VERSION = "master_geo"
+
+
+class GeoEntry(NamedTuple):
+    master_id: str
+    repair_id: int
+    address_latitude: float
+    address_longitude: float
+    price: float | None
+    time: str | None
+
+
+def get_cell(latitude: float, longitude: float) -> tuple[int, int]:
+    return (
+        math.floor(latitude / GEO_INDEX_CELL_SIZE),
+        math.floor(longitude / GEO_INDEX_CELL_SIZE),
+    )
+
+
+class MasterGeoIndex(object):
+    """Grid index of active masters' repairs: for every repair type, the
+    entries are bucketed into GEO_INDEX_CELL_SIZE-degree cells, so a box or
+    radius query only looks at the cells it covers. Repair type None holds
+    one entry per master, carrying the master's lowest price."""
+
+    def __init__(
+        self, version: int, entries: list[GeoEntry], loaded_at: datetime.datetime
+    ):
+        self.version = version
+        self.loaded_at = loaded_at
+        self._entries = tuple(entries)
+        cells = defaultdict(lambda: defaultdict(list))
+        masters = dict()
+        for entry in entries:
+            cell = get_cell(entry.address_latitude, entry.address_longitude)
+            cells[entry.repair_id][cell].append(entry)
+            master = masters.get(entry.master_id)
+            if master is None or (
+                entry.price is not None
+                and (master.price is None or entry.price < master.price)
+            ):
+                masters[entry.master_id] = entry._replace(repair_id=None, time=None)
+        for entry in masters.values():
+            cell = get_cell(entry.address_latitude, entry.address_longitude)
+            cells[None][cell].append(entry)
+        self._cells = MappingProxyType(
+            {
+                repair_id: MappingProxyType(
+                    {cell: tuple(items) for cell, items in repair_cells.items()}
+                )
+                for repair_id, repair_cells in cells.items()
+            }
+        )
+
+    def entries(self, repair_id: int | None) -> Iterator[GeoEntry]:
+        repair_cells = self._cells.get(repair_id, {})
+        return (entry for items in repair_cells.values() for entry in items)
+
+    def within(
+        self,
+        repair_id: int | None,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+    ) -> Iterator[GeoEntry]:
+        """Entries of the cells covering the box; callers check the exact
+        bounds themselves."""
+        repair_cells = self._cells.get(repair_id)
+        if not repair_cells:
+            return iter(())
+        (min_i, min_j), (max_i, max_j) = (
+            get_cell(min_lat, min_lon),
+            get_cell(max_lat, max_lon),
+        )
+        # A wide box, or one crossing the antimeridian, is answered by
+        # scanning all of the repair's cells.
+        if (
+            min_lon < -180
+            or max_lon > 180
+            or (max_i - min_i + 1) * (max_j - min_j + 1) > len(repair_cells)
+        ):
+            return self.entries(repair_id)
+        return (
+            entry
+            for i in range(min_i, max_i + 1)
+            for j in range(min_j, max_j + 1)
+            for entry in repair_cells.get((i, j), ())
+        )
+
+    @staticmethod
+    def query_entries(db: Session):
+        return (
+            db.query(
+                MasterRepair.master_id,
+                MasterRepair.repair_id,
+                MasterRepair.address_latitude,
+                MasterRepair.address_longitude,
+                MasterRepair.price,
+                MasterRepair.time,
+            )
+            .join(Master, Master.username == MasterRepair.master_id)
+            .filter(Master.is_active.is_(True))
+        )
+
+    @classmethod
+    def load(cls, db: Session, version: int) -> "MasterGeoIndex":
+        loaded_at = datetime.datetime.now()
+        rows = cls.query_entries(db).all()
+        return cls(version, [GeoEntry(*row) for row in rows], loaded_at)
+
+    def update(self, db: Session, version: int) -> "MasterGeoIndex":
+        """Reloads only the masters recorded as changed since this index was
+        loaded. The window reaches GEO_INDEX_CHANGE_SLACK seconds further
+        back, because changes are stamped before their transaction commits."""
+        loaded_at = datetime.datetime.now()
+        since = self.loaded_at - datetime.timedelta(seconds=GEO_INDEX_CHANGE_SLACK)
+        if loaded_at - since > datetime.timedelta(seconds=GEO_INDEX_CHANGE_RETENTION):
+            return self.load(db, version)
+        changed = {
+            master_id
+            for master_id, in db.query(GeoIndexChange.master_id)
+            .filter(GeoIndexChange.created_at >= since)
+            .distinct()
+        }
+        if None in changed:
+            return self.load(db, version)
+        rows = self.query_entries(db).filter(MasterRepair.master_id.in_(changed)).all()
+        entries = [entry for entry in self._entries if entry.master_id not in changed]
+        entries.extend(GeoEntry(*row) for row in rows)
+        return type(self)(version, entries, loaded_at)
+
+    def nearby(
+        self,
+        repair_id: int,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: int,
+    ) -> list[tuple[float, GeoEntry]]:
+        candidates = self.within(repair_id, *bounding_box(latitude, longitude, radius))
+        found = list()
+        for entry in candidates:
+            distance = haversine(
+                latitude, longitude, entry.address_latitude, entry.address_longitude
+            )
+            if distance <= radius:
+                found.append((distance, entry))
+        return heapq.nsmallest(limit, found, key=lambda item: item[0])
+
+
+class MasterGeoSnapshot(VersionedSnapshot[MasterGeoIndex]):
+    def mark_changed(self, db: Session, master_id: str | None) -> None:
+        """Records that the repairs or location of a master changed and bumps
+        the version in the caller's transaction, which the caller commits.
+        A master is marked once per session, i.e. once per request."""
+        marked = db.info.setdefault("geo_index_changes", set())
+        if master_id in marked:
+            return
+        marked.add(master_id)
+        db.add(GeoIndexChange(master_id=master_id))
+        bump_cache_version(db, self.name, commit=False)
+        event.listen(db, "after_commit", self._on_commit, once=True)
+        event.listen(db, "after_rollback", self._on_rollback, once=True)
+
+    def _on_commit(self, session: Session) -> None:
+        self._checked_at = 0.0
+
+    def _on_rollback(self, session: Session) -> None:
+        # The change rows are gone with the transaction, so the masters can
+        # be marked again.
+        session.info.pop("geo_index_changes", None)
+
+    def invalidate(self, db: Session) -> None:
+        self.mark_changed(db, None)
+        db.commit()
+
+
+def purge_geo_index_changes(db: Session) -> int:
+    deleted = (
+        db.query(GeoIndexChange)
+        .filter(
+            GeoIndexChange.created_at
+            < datetime.datetime.now()
+            - datetime.timedelta(seconds=GEO_INDEX_CHANGE_RETENTION)
+        )
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+master_geo_index = MasterGeoSnapshot(
+    MASTER_GEO_VERSION,
+    MasterGeoIndex.load,
+    check_interval=GEO_INDEX_CHECK_INTERVAL,
+    update=MasterGeoIndex.update,
+)
@@ -0,0 +1,97 @@
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.user import Master, BalanceLedger
+
+# Balances are floats, so drift below a kopeck is rounding.
+BALANCE_TOLERANCE = 0.005
+
+
+def change_balance(
+    db: Session,
+    master_username: str,
+    amount: float,
+    reason: str,
+    reference: str | None = None,
+    allow_negative: bool = True,
+) -> bool:
+    """Moves the balance with one UPDATE and records the move in the ledger,
+    in the caller's transaction. Returns False, changing nothing, if the
+    master is missing or the balance would go negative while that is not
+    allowed."""
+    balance = func.coalesce(Master.balance, 0)
+    query = db.query(Master).filter(Master.username == master_username)
+    if not allow_negative:
+        query = query.filter(balance + amount >= 0)
+    if not query.update({Master.balance: balance + amount}, synchronize_session=False):
+        return False
+    # The UPDATE holds the row lock, so this is the balance it produced.
+    balance_after = (
+        db.query(Master.balance).filter(Master.username == master_username).scalar()
+    )
+    db.add(
+        BalanceLedger(
+            master_username=master_username,
+            amount=amount,
+            balance_after=balance_after,
+            reason=reason,
+            reference=reference,
+        )
+    )
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Master) and obj.username == master_username:
+            db.expire(obj, ["balance"])
+    return True
+
+
+def get_ledger_balances(db: Session, usernames: list[str] | None = None):
+    """Per master, the balance the ledger adds up to: the balance before the
+    first entry plus every amount since. Masters without entries predate the
+    ledger and are skipped."""
+    first = (
+        db.query(
+            BalanceLedger.master_username,
+            func.min(BalanceLedger.id).label("first_id"),
+            func.sum(BalanceLedger.amount).label("total"),
+        )
+        .group_by(BalanceLedger.master_username)
+        .subquery()
+    )
+    query = (
+        db.query(
+            first.c.master_username,
+            BalanceLedger.balance_after - BalanceLedger.amount + first.c.total,
+            func.coalesce(Master.balance, 0),
+        )
+        .join(BalanceLedger, BalanceLedger.id == first.c.first_id)
+        .join(Master, Master.username == first.c.master_username)
+    )
+    if usernames is not None:
+        query = query.filter(first.c.master_username.in_(usernames))
+    return query.all()
+
+
+def reconcile_balances(db: Session) -> dict:
+    drifted = [
+        username
+        for username, expected, balance in get_ledger_balances(db)
+        if abs(expected - balance) > BALANCE_TOLERANCE
+    ]
+    db.rollback()
+    fixed = 0
+    for username in drifted:
+        # Locking the master row waits out any balance change in flight, so
+        # the ledger and the balance are compared at the same point.
+        db.query(Master.id).filter(Master.username == username).with_for_update().all()
+        for _, expected, balance in get_ledger_balances(db, [username]):
+            if abs(expected - balance) > BALANCE_TOLERANCE:
+                logger.error(
+                    f"Balance of {username} is {balance}, ledger says {expected}"
+                )
+                db.query(Master).filter(Master.username == username).update(
+                    {Master.balance: expected}, synchronize_session=False
+                )
+                fixed += 1
+        db.commit()
+    return {"drifted": len(drifted), "fixed": fixed}
@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from typing import NamedTuple
+
+import aiosmtplib
+from sqlalchemy.orm import Session
+
+from config.settings import (
+    EMAIL_HOST,
+    EMAIL_PORT,
+    EMAIL_USERNAME,
+    EMAIL_PASSWORD,
+    EMAIL_FROM,
+    MAIL_POOL_SIZE,
+    MAIL_TIMEOUT,
+)
+from models.user import MailDelivery
+from utils.email import CampaignTemplate
+
+MAILING_SUBJECT = "tsarbirzzha.ru | Уведомление!"
+
+
+class SendResult(NamedTuple):
+    error: str | None = None
+    # 5xx replies will not succeed on a retry.
+    permanent: bool = False
+
+
+class SMTPPool(object):
+    """At most `size` SMTP connections, each reused for as many messages as
+    the server allows; the pool size also bounds the number of messages in
+    flight."""
+
+    def __init__(self, size: int = MAIL_POOL_SIZE, **options):
+        self._slots = asyncio.Semaphore(size)
+        self._idle: list[aiosmtplib.SMTP] = list()
+        self._options = options
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        options = dict(self._options)
+        username = options.pop("username", None)
+        password = options.pop("password", None)
+        smtp = aiosmtplib.SMTP(**options)
+        await smtp.connect()
+        if username:
+            await smtp.login(username, password)
+        return smtp
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            smtp = self._idle.pop() if self._idle else None
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = await self._connect()
+                yield smtp
+            except BaseException:
+                if smtp is not None:
+                    smtp.close()
+                raise
+            self._idle.append(smtp)
+
+    async def close(self) -> None:
+        while self._idle:
+            smtp = self._idle.pop()
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+
+def get_pool() -> SMTPPool:
+    return SMTPPool(
+        hostname=EMAIL_HOST,
+        port=int(EMAIL_PORT),
+        username=EMAIL_USERNAME,
+        password=EMAIL_PASSWORD,
+        timeout=MAIL_TIMEOUT,
+        use_tls=False,
+        start_tls=False,
+    )
+
+
+async def send_message(pool: SMTPPool, message: EmailMessage) -> SendResult:
+    error = None
+    # A pooled connection may have been dropped by the server while idle, so
+    # a disconnect gets one more try on a fresh connection.
+    for _ in range(2):
+        try:
+            async with pool.connection() as smtp:
+                await smtp.send_message(message)
+            return SendResult()
+        except aiosmtplib.SMTPServerDisconnected as e:
+            error = e
+        except aiosmtplib.SMTPResponseException as e:
+            return SendResult(str(e), permanent=e.code >= 500)
+        except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+            return SendResult(str(e) or type(e).__name__)
+    return SendResult(str(error))
+
+
+async def send_messages(
+    messages: dict[int, EmailMessage], pool: SMTPPool | None = None
+) -> dict[int, SendResult]:
+    pool = pool or get_pool()
+    try:
+        results = await asyncio.gather(
+            *(send_message(pool, message) for message in messages.values())
+        )
+    finally:
+        await pool.close()
+    return dict(zip(messages.keys(), results))
+
+
+def build_message(delivery: MailDelivery, campaign: CampaignTemplate) -> EmailMessage:
+    html = campaign.render(first_name=delivery.first_name)
+    message = EmailMessage()
+    message["Subject"] = delivery.subject
+    message["From"] = EMAIL_FROM
+    message["To"] = delivery.email
+    message.set_content(html, subtype="html")
+    return message
+
+
+def deliver_mailing(db: Session, delivery_ids: list[int], final: bool) -> list[int]:
+    """Sends the pending deliveries and records the outcome of every one of
+    them; returns the ids worth retrying later."""
+    deliveries = (
+        db.query(MailDelivery)
+        .filter(MailDelivery.id.in_(delivery_ids), MailDelivery.status == "pending")
+        .all()
+    )
+    if not deliveries:
+        return []
+    # A mailing goes out to many recipients about the same order or request,
+    # so only the first name differs between their messages.
+    campaigns = dict()
+    messages = dict()
+    for delivery in deliveries:
+        key = (delivery.type, delivery.entity, delivery.subject)
+        campaign = campaigns.get(key)
+        if campaign is None:
+            campaigns[key] = campaign = CampaignTemplate(
+                "mailing.html",
+                ("first_name",),
+                entity_id=delivery.entity,
+                type=delivery.type,
+                subject=delivery.subject,
+            )
+        messages[delivery.id] = build_message(delivery, campaign)
+    results = asyncio.run(send_messages(messages))
+    retry_ids = list()
+    now = datetime.datetime.now()
+    for delivery in deliveries:
+        result = results[delivery.id]
+        delivery.attempts += 1
+        delivery.error = result.error
+        if result.error is None:
+            delivery.status = "sent"
+            delivery.sent_at = now
+        elif result.permanent or final:
+            delivery.status = "failed"
+        else:
+            retry_ids.append(delivery.id)
+    db.commit()
+    return retry_ids
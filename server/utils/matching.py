@@ -0,0 +1,71 @@
+from sqlalchemy.orm import Session
+
+from config.settings import REQUEST_FANOUT_RADIUS
+from models.user import Master
+from utils.catalog import get_catalog
+from utils.geo import bounding_box, haversine
+from utils.geo_index import master_geo_index
+
+
+def get_active_masters(
+    db: Session,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    radius: float = REQUEST_FANOUT_RADIUS,
+) -> set[str]:
+    """Usernames of all active masters, within `radius` km of the location
+    when one is given."""
+    query = db.query(
+        Master.username, Master.address_latitude, Master.address_longitude
+    ).filter(Master.is_active.is_(True))
+    if latitude is None or longitude is None:
+        return {username for username, _, _ in query}
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+    query = query.filter(
+        Master.address_latitude.between(min_lat, max_lat),
+        Master.address_longitude.between(min_lon, max_lon),
+    )
+    return {
+        username
+        for username, master_latitude, master_longitude in query
+        if haversine(latitude, longitude, master_latitude, master_longitude) <= radius
+    }
+
+
+def get_request_candidates(
+    db: Session,
+    service_type_id: int | None,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    radius: float = REQUEST_FANOUT_RADIUS,
+) -> set[str]:
+    """Usernames of the active masters offering a repair of the service type,
+    within `radius` km of the request when it has a location.
+
+    Walks service type -> devices -> repair types in the catalog snapshot and
+    repair type -> masters in the geo index, so no table is scanned. A request
+    without a service type goes to every active master, as before matching.
+    """
+    if service_type_id is None:
+        return get_active_masters(db, latitude, longitude, radius)
+    catalog = get_catalog(db)
+    index = master_geo_index.get(db)
+    has_location = latitude is not None and longitude is not None
+    candidates = set()
+    for device in catalog.devices_by_service_type.get(service_type_id, ()):
+        for repair_type in catalog.repair_types_by_device.get(device.id, ()):
+            if not has_location:
+                candidates.update(
+                    entry.master_id for entry in index.entries(repair_type.id)
+                )
+                continue
+            box = bounding_box(latitude, longitude, radius)
+            for entry in index.within(repair_type.id, *box):
+                if entry.master_id in candidates:
+                    continue
+                distance = haversine(
+                    latitude, longitude, entry.address_latitude, entry.address_longitude
+                )
+                if distance <= radius:
+                    candidates.add(entry.master_id)
+    return candidates
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import tempfile
+
+from starlette.datastructures import UploadFile
+
+from config.settings import MEDIA_CHUNK_SIZE, MEDIA_MAX_UPLOAD_SIZE
+from utils.app_exceptions import AppException
+
+MEDIA_ROOT = "media"
+FILES_DIR = "files"
+IMAGE_HEAD_SIZE = 12
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+)
+
+
+def get_extension(filename: str | None) -> str:
+    if not filename or "." not in filename:
+        return ""
+    return filename[filename.rindex(".") :].lower()
+
+
+def get_image_extension(head: bytes) -> str | None:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def get_blob_link(digest: str, extension: str) -> str:
+    return f"{FILES_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def save_upload(file: UploadFile, image: bool = False) -> str:
+    # Single pass over the upload: every chunk is hashed and written to a temp
+    # file, the first one is also sniffed, and the size limit is enforced
+    # before anything past it is buffered.
+    files_path = os.path.join(MEDIA_ROOT, FILES_DIR)
+    os.makedirs(files_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=files_path)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        with os.fdopen(fd, "wb") as f:
+            while chunk := file.file.read(MEDIA_CHUNK_SIZE):
+                if len(head) < IMAGE_HEAD_SIZE:
+                    head += chunk[: IMAGE_HEAD_SIZE - len(head)]
+                size += len(chunk)
+                if size > MEDIA_MAX_UPLOAD_SIZE:
+                    raise AppException.TooLargeException(
+                        detail=f"Файл превышает размер в "
+                        f"{MEDIA_MAX_UPLOAD_SIZE // (1024 * 1024)}МБ"
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+        image_extension = get_image_extension(head)
+        if image and image_extension is None:
+            raise AppException.ValidationException(
+                detail="Файл не является изображением!"
+            )
+
+        link = get_blob_link(
+            digest.hexdigest(), image_extension or get_extension(file.filename)
+        )
+        path = os.path.join(MEDIA_ROOT, link)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return link
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return link
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,42 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from utils.app_exceptions import AppException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise AppException.ValidationException(detail="Некорректный курсор!")
+
+
+def paginate(query: Query, model, cursor: str | None, limit: int) -> dict:
+    # Keyset pagination over (created_at, id), newest first: the page starts
+    # right after the last row the client has seen, so the cost of a page does
+    # not depend on how deep into the feed it is.
+    if cursor:
+        query = query.filter(
+            tuple_(model.created_at, model.id) < tuple_(*decode_cursor(cursor))
+        )
+    rows = (
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return {"items": rows, "next_cursor": next_cursor}
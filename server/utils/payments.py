@@ -0,0 +1,153 @@
+import datetime
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from yookassa import Payment
+
+from config.settings import (
+    PAYMENT_RECONCILE_MAX_AGE,
+    PAYMENT_RECONCILE_BACKOFF,
+    PAYMENT_RECONCILE_MAX_BACKOFF,
+    PAYMENT_RECONCILE_BATCH_SIZE,
+    PAYMENT_RECONCILE_CHUNK_SIZE,
+    PAYMENT_RECONCILE_CONCURRENCY,
+)
+from models.user import Payment as DBPayment
+from utils.ledger import change_balance
+
+PENDING_STATUSES = ("pending", "waiting_for_capture")
+FINAL_STATUSES = ("succeeded", "canceled")
+
+
+def set_payment_status(
+    db: Session, payment: DBPayment, status: str, paid: bool
+) -> bool:
+    """Moves a locked payment row to a status reported by YooKassa. A payment
+    in a final status is never changed again, so repeated webhooks, polling
+    and the return page together credit the balance only once."""
+    if payment.status in FINAL_STATUSES or payment.status == status:
+        return False
+    payment.status = status
+    payment.paid = paid
+    if status == "succeeded":
+        change_balance(
+            db,
+            payment.master_username,
+            payment.amount,
+            "payment",
+            f"payment:{payment.payment_id}",
+        )
+        payment.is_confirmed = True
+    return True
+
+
+def apply_payment_status(
+    db: Session, payment_id: uuid.UUID, status: str, paid: bool
+) -> DBPayment | None:
+    payment = (
+        db.query(DBPayment)
+        .filter(DBPayment.payment_id == payment_id)
+        .with_for_update()
+        .first()
+    )
+    if payment is None or not set_payment_status(db, payment, status, paid):
+        db.rollback()
+        return payment
+    db.commit()
+    return payment
+
+
+def lookup_payment(payment_id: uuid.UUID) -> tuple[str, bool] | None:
+    try:
+        payment = Payment.find_one(str(payment_id))
+    except Exception as e:
+        logger.bind(payment_id=str(payment_id)).warning(
+            f"Payment lookup failed: {e}"
+        )
+        return None
+    return payment.status, payment.paid
+
+
+def get_next_check_at(now: datetime.datetime, attempts: int) -> datetime.datetime:
+    delay = min(
+        PAYMENT_RECONCILE_BACKOFF * 2 ** min(attempts, 16),
+        PAYMENT_RECONCILE_MAX_BACKOFF,
+    )
+    return now + datetime.timedelta(seconds=delay)
+
+
+def reconcile_chunk(bind, payment_ids: list[uuid.UUID], now: datetime.datetime) -> int:
+    """Looks the payments up, then applies the results to the locked rows in
+    one short transaction; returns how many payments changed status."""
+    results = {payment_id: lookup_payment(payment_id) for payment_id in payment_ids}
+    db = Session(bind=bind, autoflush=False)
+    try:
+        payments = (
+            db.query(DBPayment)
+            .filter(DBPayment.payment_id.in_(payment_ids))
+            .with_for_update()
+            .all()
+        )
+        changed = 0
+        for payment in payments:
+            result = results[payment.payment_id]
+            if result is not None and set_payment_status(db, payment, *result):
+                changed += 1
+            elif payment.status in PENDING_STATUSES:
+                payment.next_check_at = get_next_check_at(
+                    now, payment.check_attempts or 0
+                )
+                payment.check_attempts = (payment.check_attempts or 0) + 1
+        db.commit()
+        return changed
+    finally:
+        db.close()
+
+
+def reconcile_payments(db: Session) -> dict:
+    """Polls YooKassa for pending payments the webhook has not settled. Each
+    payment is checked again after an exponentially growing delay and given
+    up after PAYMENT_RECONCILE_MAX_AGE. The due payments are split into
+    chunks handled by PAYMENT_RECONCILE_CONCURRENCY threads."""
+    started = time.perf_counter()
+    now = datetime.datetime.now()
+    payment_ids = [
+        payment_id
+        for payment_id, in db.query(DBPayment.payment_id)
+        .filter(
+            DBPayment.status.in_(PENDING_STATUSES),
+            DBPayment.created_at
+            >= now - datetime.timedelta(seconds=PAYMENT_RECONCILE_MAX_AGE),
+            or_(DBPayment.next_check_at.is_(None), DBPayment.next_check_at <= now),
+        )
+        .order_by(DBPayment.next_check_at.nullsfirst())
+        .limit(PAYMENT_RECONCILE_BATCH_SIZE)
+    ]
+    db.rollback()
+    chunks = [
+        payment_ids[start : start + PAYMENT_RECONCILE_CHUNK_SIZE]
+        for start in range(0, len(payment_ids), PAYMENT_RECONCILE_CHUNK_SIZE)
+    ]
+    failed = 0
+    changed = 0
+    with ThreadPoolExecutor(PAYMENT_RECONCILE_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(reconcile_chunk, db.get_bind(), chunk, now)
+            for chunk in chunks
+        ]
+        for future in futures:
+            try:
+                changed += future.result()
+            except Exception as e:
+                logger.error(f"Payment reconciliation chunk failed: {e}")
+                failed += 1
+    return {
+        "checked": len(payment_ids),
+        "changed": changed,
+        "failed_chunks": failed,
+        "duration": round(time.perf_counter() - started, 3),
+    }
@@ -1,8 +1,27 @@
+import asyncio
+import time
 from typing import Match
-import requests
+
+import httpx
 import re
+from loguru import logger
+
+from config.settings import (
+    SMS_URL,
+    SMS_TIMEOUT,
+    SMS_MAX_CONNECTIONS,
+    SMS_MAX_RETRIES,
+    SMS_RETRY_BACKOFF,
+    SMS_BREAKER_THRESHOLD,
+    SMS_BREAKER_RESET,
+)
 from utils.app_exceptions import AppException
 
+# Connecting failed or the gateway answered with an error, so the message was
+# not sent and can be retried. A read timeout is not retried: the gateway may
+# have sent the code already.
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 
 class TSMSResponse:
     id: str = "0"
@@ -11,33 +30,113 @@ class TSMSResponse:
     balance: float = 0
 
 
+class CircuitBreaker(object):
+    """Opens after `threshold` failures in a row and fails calls fast until
+    `reset_timeout` seconds pass; then one call is let through, and its result
+    closes or reopens the breaker."""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.opened_at = time.monotonic()
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+_client: httpx.AsyncClient | None = None
+breaker = CircuitBreaker(SMS_BREAKER_THRESHOLD, SMS_BREAKER_RESET)
+
+
+def get_sms_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=SMS_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SMS_MAX_CONNECTIONS,
+                max_keepalive_connections=SMS_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_sms_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 class SMSTransport:
-    _URL = "https://sms.ru/sms/send"
+    _URL = SMS_URL
 
     def __init__(self, api_id):
         self._api_id = api_id
 
-    def send(self, to: str, msg: str) -> None:
+    async def _request(self, params: dict) -> dict:
+        client = get_sms_client()
+        for attempt in range(SMS_MAX_RETRIES + 1):
+            if attempt:
+                if not breaker.allow():
+                    break
+                await asyncio.sleep(SMS_RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                response = await client.get(self._URL, params=params)
+            except RETRY_EXCEPTIONS:
+                breaker.failure()
+                continue
+            except httpx.HTTPError:
+                breaker.failure()
+                break
+            if response.status_code >= 500 or response.status_code == 429:
+                breaker.failure()
+                continue
+            breaker.success()
+            return response.json()
+        raise AppException.ServiceUnavailableException(
+            "Не удалось отправить код подтверждения!"
+        )
+
+    async def send(self, to: str, msg: str) -> None:
         if not self.validate_phone(to):
             raise AppException.ValidationException("Некорректный номер телефона!")
+        if not breaker.allow():
+            raise AppException.ServiceUnavailableException(
+                "Сервис отправки SMS временно недоступен!"
+            )
 
-        response = requests.get(
-            self._URL,
-            params={
+        response = await self._request(
+            {
                 "api_id": self._api_id,
                 "to": to,
                 "msg": msg,
                 "json": 1,
                 "from": "xorwise.dev",
-            },
-        ).json()
+            }
+        )
 
-        print(response)
         if response["status"] == "OK":
             phone = response["sms"][to]
 
             if phone["status"] == "OK":
                 return
+        logger.bind(sms_response=response).warning("SMS gateway rejected a message")
         raise AppException.InternalServerException(
             "Не удалось отправить код подтверждения!"
         )
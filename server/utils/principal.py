@@ -0,0 +1,58 @@
+from typing import NamedTuple
+
+from sqlalchemy.orm import Session
+
+from config.settings import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+from models.user import Client, Master
+from utils.cache import TTLCache
+
+
+class Principal(NamedTuple):
+    client_id: int
+    master_id: int | None
+    is_superuser: bool
+    is_email_verified: bool
+    is_phone_verified: bool
+
+
+# Profile changes made through this worker invalidate their entry right away;
+# other workers see them once the entry expires.
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+def principal_from_client(client: Client) -> Principal:
+    """Principal of a client loaded with its master."""
+    return Principal(
+        client.id,
+        client.master[0].id if client.master else None,
+        bool(client.is_superuser),
+        bool(client.is_email_verified),
+        bool(client.is_phone_verified),
+    )
+
+
+def load_principal(db: Session, client_id: int) -> Principal | None:
+    principal = principal_cache.get(client_id)
+    if principal is not None:
+        return principal
+    row = (
+        db.query(
+            Client.id,
+            Master.id,
+            Client.is_superuser,
+            Client.is_email_verified,
+            Client.is_phone_verified,
+        )
+        .outerjoin(Master, Master.client_id == Client.id)
+        .filter(Client.id == client_id)
+        .first()
+    )
+    if row is None:
+        return None
+    principal = Principal(row[0], row[1], *(bool(flag) for flag in row[2:]))
+    principal_cache.set(client_id, principal)
+    return principal
+
+
+def invalidate_principal(client_id: int) -> None:
+    principal_cache.delete(client_id)
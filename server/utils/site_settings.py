@@ -0,0 +1,30 @@
+from typing import NamedTuple
+
+from sqlalchemy.orm import Session
+
+from config.settings import COMMISSION, SETTINGS_CHECK_INTERVAL
+from models.index import Settings
+from utils.cache import VersionedSnapshot
+
+SETTINGS_VERSION = "settings"
+
+
+class SiteSettings(NamedTuple):
+    version: int
+    commission: float
+
+    @classmethod
+    def load(cls, db: Session, version: int) -> "SiteSettings":
+        settings = db.query(Settings).filter(Settings.id == 1).first()
+        return cls(version, settings.commission if settings else COMMISSION)
+
+
+settings_snapshot = VersionedSnapshot(
+    SETTINGS_VERSION,
+    SiteSettings.load,
+    check_interval=SETTINGS_CHECK_INTERVAL,
+)
+
+
+def get_settings(db: Session) -> SiteSettings:
+    return settings_snapshot.get(db)
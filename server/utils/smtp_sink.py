@@ -0,0 +1,95 @@
+"""Local SMTP server that accepts every message and keeps it in memory, for
+running the mailing against without a real mail server:
+
+    python -m utils.smtp_sink --port 1025
+
+with EMAIL_HOST=127.0.0.1 and EMAIL_PORT=1025."""
+
+import argparse
+import asyncio
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+
+class SMTPSink(object):
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025):
+        self.host = host
+        self.port = port
+        self.messages: list[EmailMessage] = list()
+        self.connections = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 smtp-sink ready")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-smtp-sink")
+                    await reply("250-8BITMIME")
+                    await reply("250 AUTH PLAIN LOGIN")
+                elif verb == "HELO":
+                    await reply("250 smtp-sink")
+                elif verb == "AUTH":
+                    if command.upper().startswith("AUTH LOGIN"):
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    await reply("235 Authentication successful")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = list()
+                    while (line := await reader.readline()) not in (b".\r\n", b""):
+                        data.append(line[1:] if line.startswith(b"..") else line)
+                    self.messages.append(
+                        message_from_bytes(b"".join(data), policy=policy.default)
+                    )
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    # MAIL, RCPT, RSET and NOOP are accepted as is.
+                    await reply("250 OK")
+        finally:
+            writer.close()
+
+
+async def main(host: str, port: int) -> None:
+    sink = SMTPSink(host, port)
+    await sink.start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port}")
+    try:
+        while True:
+            count = len(sink.messages)
+            await asyncio.sleep(1)
+            for message in sink.messages[count:]:
+                print(f"{message['To']}: {message['Subject']}")
+    finally:
+        await sink.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -1,50 +1,104 @@
 from starlette.websockets import WebSocket, WebSocketState
 
+from utils.backplane import get_backplane
+
+
+async def _send_all(sockets: set[WebSocket], data) -> None:
+    for websocket in list(sockets):
+        if websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.send_json(data)
+
 
 class SocketManager(object):
-    active_connections: dict[int, WebSocket] = dict()
+    # A user may be connected from several tabs; the channel is subscribed
+    # and the presence held while at least one of them is open.
+    active_connections: dict[int, set[WebSocket]] = dict()
 
     def __new__(cls):
         if not hasattr(cls, "instance"):
             cls.instance = super(SocketManager, cls).__new__(cls)
         return cls.instance
 
+    @staticmethod
+    def channel(user_id: int) -> str:
+        return f"ws:user:{user_id}"
+
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        sockets = self.active_connections.setdefault(user_id, set())
+        sockets.add(websocket)
+        if len(sockets) > 1:
+            return
 
-    def disconnect(self, user_id: int):
+        async def deliver(data):
+            await self.send_local_message(data, user_id)
+
+        await get_backplane().subscribe(self.channel(user_id), deliver)
+        await get_backplane().add_presence("users", str(user_id))
+
+    async def disconnect(self, websocket: WebSocket, user_id: int):
+        sockets = self.active_connections.get(user_id)
+        if sockets is None or websocket not in sockets:
+            return
+        sockets.discard(websocket)
+        if sockets:
+            return
         del self.active_connections[user_id]
+        await get_backplane().unsubscribe(self.channel(user_id))
+        await get_backplane().remove_presence("users", str(user_id))
+
+    async def get_online_users(self) -> list[int]:
+        members = await get_backplane().get_presence("users")
+        return [int(member) for member in members]
 
     async def send_direct_message(self, data, user_id: int):
-        if user_id in self.active_connections:
-            if (
-                self.active_connections[user_id].application_state
-                == WebSocketState.CONNECTED
-            ):
-                await self.active_connections[user_id].send_json(data)
+        await get_backplane().publish(self.channel(user_id), data)
+
+    async def send_local_message(self, data, user_id: int):
+        await _send_all(self.active_connections.get(user_id, set()), data)
 
 
 class SocketChatManager(object):
-    active_connections: dict[(int, int), WebSocket] = dict()
+    active_connections: dict[(int, int), set[WebSocket]] = dict()
 
     def __new__(cls):
         if not hasattr(cls, "instance"):
             cls.instance = super(SocketChatManager, cls).__new__(cls)
         return cls.instance
 
+    @staticmethod
+    def channel(user_id: int, dialog_id: int) -> str:
+        return f"ws:chat:{dialog_id}:{user_id}"
+
     async def connect(self, websocket: WebSocket, user_id: int, dialog_id: int):
         await websocket.accept()
-        self.active_connections[(user_id, dialog_id)] = websocket
+        sockets = self.active_connections.setdefault((user_id, dialog_id), set())
+        sockets.add(websocket)
+        if len(sockets) > 1:
+            return
+
+        async def deliver(data):
+            await self.send_local_message(data, user_id, dialog_id)
 
-    def disconnect(self, user_id: int, dialog_id: int):
+        await get_backplane().subscribe(self.channel(user_id, dialog_id), deliver)
+        await get_backplane().add_presence("chats", f"{user_id}:{dialog_id}")
+
+    async def disconnect(self, websocket: WebSocket, user_id: int, dialog_id: int):
+        sockets = self.active_connections.get((user_id, dialog_id))
+        if sockets is None or websocket not in sockets:
+            return
+        sockets.discard(websocket)
+        if sockets:
+            return
         del self.active_connections[(user_id, dialog_id)]
+        await get_backplane().unsubscribe(self.channel(user_id, dialog_id))
+        await get_backplane().remove_presence("chats", f"{user_id}:{dialog_id}")
+
+    async def is_connected(self, user_id: int, dialog_id: int) -> bool:
+        return await get_backplane().has_presence("chats", f"{user_id}:{dialog_id}")
 
     async def send_direct_message(self, data, user_id: int, dialog_id: int):
-        if (user_id, dialog_id) in self.active_connections:
-            if (
-                self.active_connections[(user_id, dialog_id)].application_state
-                == WebSocketState.CONNECTED
-            ):
-                print(data)
-                await self.active_connections[(user_id, dialog_id)].send_json(data)
+        await get_backplane().publish(self.channel(user_id, dialog_id), data)
+
+    async def send_local_message(self, data, user_id: int, dialog_id: int):
+        await _send_all(self.active_connections.get((user_id, dialog_id), set()), data)
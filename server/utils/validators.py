@@ -1,8 +1,8 @@
 import re
-import os
 from starlette.datastructures import UploadFile
 from config.database import get_db
 from models import tables_dict
+from utils.media import save_upload
 import phonenumbers
 
 
@@ -46,27 +46,7 @@ async def upload_file(
         new_files = list()
         for file in files:
             if file.filename != "":
-                if os.path.exists(f"media/files/{file.filename}"):
-                    i = 1
-                    paths_parts = [
-                        file.filename[: file.filename.rindex(".")],
-                        file.filename[file.filename.rindex(".") + 1 :],
-                    ]
-                    while os.path.exists(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}"
-                    ):
-                        i += 1
-                    with open(
-                        f"media/files/{paths_parts[0]}({i}).{paths_parts[1]}", "wb"
-                    ) as f:
-                        content = file.file.read()
-                        f.write(content)
-                        file_link = f.name[6:]
-                else:
-                    with open(f"media/files/{file.filename}", "wb") as f:
-                        content = file.file.read()
-                        f.write(content)
-                        file_link = f.name[6:]
+                file_link = save_upload(file)
                 new_files.append(
                     (file_link, False) if type(data[field_name]) == tuple else file_link
                 )
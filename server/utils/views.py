@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from collections import Counter
+
+from loguru import logger
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+
+from config.database import get_db
+from config.settings import VIEW_COUNTER, VIEW_COUNTER_URL, VIEW_FLUSH_INTERVAL
+from models.index import Article
+from models.submission import ServiceRequest
+
+COUNTED_MODELS = {
+    ServiceRequest.__tablename__: ServiceRequest,
+    Article.__tablename__: Article,
+}
+
+
+class ViewCounter(object):
+    """Write-behind buffer for the `views` columns.
+
+    Reads only record a hit here; the buffered increments are added to the
+    rows in batches by `flush_views`, so viewing a popular request does not
+    take a row lock on every GET.
+    """
+
+    def hit(self, table: str, id: int) -> None:
+        raise NotImplementedError
+
+    def drain(self) -> dict[str, Counter]:
+        raise NotImplementedError
+
+    def merge(self, hits: dict[str, Counter]) -> None:
+        raise NotImplementedError
+
+
+class InMemoryViewCounter(ViewCounter):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits: dict[str, Counter] = dict()
+
+    def hit(self, table: str, id: int) -> None:
+        with self._lock:
+            self._hits.setdefault(table, Counter())[id] += 1
+
+    def drain(self) -> dict[str, Counter]:
+        with self._lock:
+            hits, self._hits = self._hits, dict()
+        return hits
+
+    def merge(self, hits: dict[str, Counter]) -> None:
+        with self._lock:
+            for table, counter in hits.items():
+                self._hits.setdefault(table, Counter()).update(counter)
+
+
+# Reads and deletes a hash in one step, so a hit recorded during a flush lands
+# in a fresh hash instead of being lost, and a missing hash is just empty.
+DRAIN_SCRIPT = """
+local values = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return values
+"""
+
+
+class RedisViewCounter(ViewCounter):
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._drain = self._redis.register_script(DRAIN_SCRIPT)
+
+    def hit(self, table: str, id: int) -> None:
+        self._redis.hincrby(f"views:{table}", str(id), 1)
+
+    def drain(self) -> dict[str, Counter]:
+        hits = dict()
+        try:
+            for table in COUNTED_MODELS:
+                values = self._drain(keys=[f"views:{table}"])
+                if values:
+                    hits[table] = Counter(
+                        {int(id): int(n) for id, n in zip(values[::2], values[1::2])}
+                    )
+        except Exception:
+            # The tables drained so far go back before the error is raised.
+            self.merge(hits)
+            raise
+        return hits
+
+    def merge(self, hits: dict[str, Counter]) -> None:
+        pipe = self._redis.pipeline()
+        for table, counter in hits.items():
+            for id, n in counter.items():
+                pipe.hincrby(f"views:{table}", str(id), n)
+        pipe.execute()
+
+
+_view_counter: ViewCounter | None = None
+
+
+def get_view_counter() -> ViewCounter:
+    global _view_counter
+    if _view_counter is None:
+        if VIEW_COUNTER == "redis":
+            _view_counter = RedisViewCounter(VIEW_COUNTER_URL)
+        else:
+            _view_counter = InMemoryViewCounter()
+    return _view_counter
+
+
+def flush_views(db: Session) -> int:
+    counter = get_view_counter()
+    hits = counter.drain()
+    try:
+        for table, table_hits in hits.items():
+            model = COUNTED_MODELS[table]
+            db.execute(
+                update(model)
+                .where(model.id == bindparam("_id"))
+                .values(views=func.coalesce(model.views, 0) + bindparam("_n")),
+                [{"_id": id, "_n": n} for id, n in table_hits.items()],
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        counter.merge(hits)
+        raise
+    return sum(sum(table_hits.values()) for table_hits in hits.values())
+
+
+def flush_views_once() -> int:
+    db = next(get_db())
+    try:
+        return flush_views(db)
+    finally:
+        db.close()
+
+
+async def run_view_flusher() -> None:
+    while True:
+        await asyncio.sleep(VIEW_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(flush_views_once)
+        except Exception as e:
+            logger.error(f"View counter flush failed: {e}")
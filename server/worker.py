@@ -5,8 +5,21 @@ dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
 if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path)
 
+import redis
 from celery import Celery
-from config.settings import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from loguru import logger
+from redis.exceptions import LockError
+from config.settings import (
+    CELERY_BROKER_URL,
+    CELERY_RESULT_BACKEND,
+    MAIL_MAX_RETRIES,
+    MAIL_RETRY_BACKOFF,
+    PAYMENT_RECONCILE_LOCK_URL,
+    PAYMENT_RECONCILE_LOCK_TIMEOUT,
+    REQUEST_EXPIRY_BATCH_SIZE,
+    VIEW_COUNTER,
+    VIEW_FLUSH_INTERVAL,
+)
 from celery.schedules import crontab
 
 celery = Celery(__name__)
@@ -14,48 +27,105 @@ celery = Celery(__name__)
 celery.conf.broker_url = CELERY_BROKER_URL
 celery.conf.result_backend = CELERY_RESULT_BACKEND
 
-celery.conf.task_routes = {"worker.delete_request": "delete_request"}
-
 celery.conf.beat_schedule = {
     "celery_beat_payments": {
         "task": "worker.confirm_payments",
         "schedule": crontab(minute="*/1"),
-    }
+        # Runs queued behind a busy worker are dropped, not piled up.
+        "options": {"expires": 60},
+    },
+    "celery_beat_reconcile_balances": {
+        "task": "worker.reconcile_balances",
+        "schedule": crontab(minute=0),
+    },
+    "celery_beat_purge_geo_index_changes": {
+        "task": "worker.purge_geo_index_changes",
+        "schedule": crontab(minute=30),
+    },
+    "celery_beat_expire_requests": {
+        "task": "worker.expire_requests",
+        "schedule": crontab(minute="*/1"),
+    },
 }
 
+if VIEW_COUNTER == "redis":
+    celery.conf.beat_schedule["celery_beat_views"] = {
+        "task": "worker.flush_views",
+        "schedule": VIEW_FLUSH_INTERVAL,
+    }
+
 celery.autodiscover_tasks()
 
-from yookassa import Payment
 from config.yookassa import Configuration
 from config.database import get_db
-from models import ServiceRequest, StatusEnum, Payment as DBPayment, Master
+from utils.geo_index import purge_geo_index_changes as purge_geo_changes
+from utils.ledger import reconcile_balances as reconcile_ledger
+from utils.mailer import deliver_mailing
+from utils.payments import reconcile_payments
+from utils.views import flush_views_once
 
 
 @celery.task
-def delete_request(request_id):
+def expire_requests():
+    # The cruds enqueue tasks from this module, so they are imported lazily.
+    from cruds.submission import SubmissionCRUD
+
     db = next(get_db())
-    request = db.query(ServiceRequest).filter(ServiceRequest.id == request_id).first()
-    if request.status == StatusEnum.active:
-        db.delete(request)
-        db.commit()
-        print(f"Request #{request.id} deleted")
+    deleted = SubmissionCRUD(db).delete_expired_requests(REQUEST_EXPIRY_BATCH_SIZE)
+    print(f"{deleted} expired requests deleted...")
+
+
+@celery.task(bind=True, max_retries=MAIL_MAX_RETRIES)
+def send_mailing(self, delivery_ids: list[int]):
+    db = next(get_db())
+    final = self.request.retries >= self.max_retries
+    retry_ids = deliver_mailing(db, delivery_ids, final=final)
+    print(f"{len(delivery_ids) - len(retry_ids)} mailing deliveries processed...")
+    if retry_ids:
+        raise self.retry(
+            args=[retry_ids], countdown=MAIL_RETRY_BACKOFF * 2**self.request.retries
+        )
+
+
+@celery.task
+def purge_geo_index_changes():
+    db = next(get_db())
+    deleted = purge_geo_changes(db)
+    print(f"{deleted} geo index changes purged...")
+
+
+@celery.task
+def flush_views():
+    flushed = flush_views_once()
+    print(f"{flushed} views flushed...")
 
 
 @celery.task
 def confirm_payments():
+    # A run outlasting the beat interval must not overlap the next one.
+    lock = redis.from_url(PAYMENT_RECONCILE_LOCK_URL).lock(
+        "lock:confirm_payments", timeout=PAYMENT_RECONCILE_LOCK_TIMEOUT
+    )
+    if not lock.acquire(blocking=False):
+        print("Payments are already being checked...")
+        return None
+    try:
+        db = next(get_db())
+        metrics = reconcile_payments(db)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+    logger.bind(**metrics).info(
+        f"{metrics['checked']} payments checked in {metrics['duration']}s..."
+    )
+    return metrics
+
+
+@celery.task
+def reconcile_balances():
     db = next(get_db())
-    payments = db.query(DBPayment).filter(DBPayment.status == "pending").all()
-    for payment in payments:
-        payment_info = Payment.find_one(str(payment.payment_id))
-        if payment_info.status == "succeeded":
-            master = (
-                db.query(Master)
-                .filter(Master.username == payment.master_username)
-                .first()
-            )
-            master.balance += payment.amount
-            payment.is_confirmed = True
-        payment.status = payment_info.status
-        payment.paid = payment_info.paid
-    print(f"{len(payments)} payments checked...")
-    db.commit()
+    result = reconcile_ledger(db)
+    print(f"{result['fixed']} balances reconciled with the ledger...")
+    return result